@@ -0,0 +1,76 @@
+"""Microbenchmark for the scrapers' HTML parsing.
+
+Runs each bot's real extraction function over the pages in fixtures/ with the
+stdlib parser, lxml on the full page, and lxml restricted to the containers the
+bot reads (the default). Usage: python benchmarks/parse_bench.py [rounds]
+
+The fixtures are synthetic: generated pages with each site's container markup
+and filler text, not snapshots of the live sites. The timings compare parser
+configurations on that markup only and do not predict the speed-up on real
+pages; the output check only shows the configurations agree on these pages.
+"""
+import contextlib, io, os, sys, timeit
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIXTURES = os.path.join(BASE_DIR, "benchmarks", "fixtures")
+sys.path.insert(0, BASE_DIR)
+for bot in ("hocean", "ph", "nhentai"):
+    sys.path.insert(0, os.path.join(BASE_DIR, bot))
+
+import common.parsing as parsing
+import hocean_bot, ph_bot, nhentai_bot
+
+CONFIGS = [
+    ("html.parser, full page", "html.parser", False),
+    ("lxml, full page", "lxml", False),
+    ("lxml, strained", "lxml", True),
+]
+
+
+def read_fixture(name):
+    with open(os.path.join(FIXTURES, name), "r", encoding="utf-8") as f:
+        return f.read()
+
+
+def cases():
+    nh_home = read_fixture("nhentai_home.html")
+    nh_gallery = read_fixture("nhentai_gallery.html")
+    ph_listing = read_fixture("ph_listing.html")
+    ho_recent = read_fixture("hocean_recent.html")
+    ho_detail = read_fixture("hocean_detail.html")
+    return [
+        ("nhentai homepage", lambda: nhentai_bot.parse_listing(nh_home)),
+        ("nhentai gallery", lambda: nhentai_bot.build_record("500001", "t", nh_gallery, None)),
+        ("ph listing", lambda: ph_bot.parse(ph_listing)),
+        ("hocean recent", lambda: hocean_bot.parse_recent_links(ho_recent)),
+        ("hocean detail", lambda: hocean_bot.parse_detail_html("https://hentaiocean.com/x", ho_detail)),
+    ]
+
+
+def run(rounds):
+    results = {}
+    for label, parser, partial in CONFIGS:
+        parsing.PARSER, parsing.PARTIAL_PARSING = parser, partial
+        for name, fn in cases():
+            # the bots print progress while parsing; keep the table readable
+            with contextlib.redirect_stdout(io.StringIO()):
+                output = fn()
+                best = min(timeit.repeat(fn, number=1, repeat=rounds))
+            results.setdefault(name, []).append((label, best, output))
+    return results
+
+
+def main():
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    results = run(rounds)
+    print(f"{'fixture':<18}" + "".join(f"{label:>26}" for label, _, _ in CONFIGS) + f"{'ratio':>10}")
+    for name, row in results.items():
+        baseline = row[0][1]
+        # every configuration must extract the same data
+        same = all(output == row[0][2] for _, _, output in row)
+        cells = "".join(f"{best * 1000:>23.2f} ms" for _, best, _ in row)
+        print(f"{name:<18}{cells}{baseline / row[-1][1]:>9.1f}x" + ("" if same else "  OUTPUT DIFFERS"))
+
+
+if __name__ == "__main__":
+    main()
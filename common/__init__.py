@@ -0,0 +1,5 @@
+"""Helpers shared by the feed bots (reddit, hocean, ph, nhentai).
+
+The bots are run as plain scripts (``python reddit/reddit_bot.py``), so each
+one puts the repository root on ``sys.path`` before importing from here.
+"""
@@ -0,0 +1,80 @@
+"""Scalable Bloom filter for compact, long-horizon "seen before" checks.
+
+A Bloom filter answers "definitely not added" or "probably added" from a bit
+array, at about 2.4 bytes per item for a 1-in-10,000 false-positive rate. The
+scalable variant (Almeida et al.) adds a new, larger slice with a tighter error
+rate whenever the current one is full, so the overall false-positive rate stays
+bounded however many items are added. Slices serialize to plain bytes; the
+state store keeps them next to the exact seen table.
+"""
+import hashlib
+import math
+
+DEFAULT_CAPACITY = 10000
+DEFAULT_ERROR_RATE = 1e-4
+GROWTH = 2
+TIGHTENING = 0.5
+
+
+def _hashes(key):
+    """Two independent 64-bit hashes of key (double hashing derives the rest)."""
+    digest = hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+    return int.from_bytes(digest[:8], "little"), int.from_bytes(digest[8:], "little") | 1
+
+
+class BloomFilter:
+    def __init__(self, capacity, error_rate, bits=None, count=0):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.num_bits = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.num_hashes = max(1, round(self.num_bits / capacity * math.log(2)))
+        self.bits = bytearray(bits) if bits is not None else bytearray((self.num_bits + 7) // 8)
+        self.count = count
+
+    def _positions(self, key):
+        h1, h2 = _hashes(key)
+        return [(h1 + i * h2) % self.num_bits for i in range(self.num_hashes)]
+
+    def add(self, key):
+        for pos in self._positions(key):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+
+    def __contains__(self, key):
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(key))
+
+    @property
+    def full(self):
+        return self.count >= self.capacity
+
+
+class ScalableBloomFilter:
+    def __init__(self, capacity=DEFAULT_CAPACITY, error_rate=DEFAULT_ERROR_RATE, slices=None):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.slices = list(slices or [])
+        # indexes of slices changed since load, so only those are written back
+        self.dirty = set()
+
+    def __contains__(self, key):
+        return any(key in s for s in self.slices)
+
+    def add(self, key):
+        """Add key unless it is (probably) present already. Returns True if added."""
+        if key in self:
+            return False
+        if not self.slices or self.slices[-1].full:
+            n = len(self.slices)
+            self.slices.append(BloomFilter(
+                self.capacity * GROWTH ** n,
+                self.error_rate * (1 - TIGHTENING) * TIGHTENING ** n,
+            ))
+        self.slices[-1].add(key)
+        self.dirty.add(len(self.slices) - 1)
+        return True
+
+    def __len__(self):
+        return sum(s.count for s in self.slices)
+
+    def size_bytes(self):
+        return sum(len(s.bits) for s in self.slices)
@@ -0,0 +1,169 @@
+"""Playwright helpers shared by the browser-based scrapers (ph, nhentai)."""
+import json
+import logging
+import os
+import time
+from urllib.parse import urlparse
+
+logger = logging.getLogger(__name__)
+
+# Abort images, media, fonts and third-party requests: the scrapers only read the HTML.
+BLOCK_RESOURCES = os.getenv("BLOCK_RESOURCES", "true").lower() in ("1", "true", "yes")
+BLOCKED_RESOURCE_TYPES = {"image", "media", "font"}
+# Cloudflare challenge assets must load or the clearance cookie is never issued
+ALLOWED_HOSTS = ("challenges.cloudflare.com",)
+ALLOWED_PATH_PREFIX = "/cdn-cgi/"
+
+
+def host_matches(host, domains):
+    """True if host is one of domains or a subdomain of one."""
+    host = (host or "").lower()
+    return any(host == d or host.endswith("." + d) for d in domains)
+
+
+def should_block(url, resource_type, first_party):
+    """Decide whether a request should be aborted.
+    first_party: domains (subdomains included) the scraped site serves its pages/scripts from.
+    """
+    parsed = urlparse(url)
+    if parsed.scheme not in ("http", "https"):
+        return False
+    if parsed.path.startswith(ALLOWED_PATH_PREFIX) or host_matches(parsed.hostname, ALLOWED_HOSTS):
+        return False
+    if resource_type in BLOCKED_RESOURCE_TYPES:
+        return True
+    return not host_matches(parsed.hostname, first_party)
+
+
+class ResourceFilter:
+    """Route handler aborting unneeded requests; counts what it blocked for the run log."""
+
+    def __init__(self, first_party):
+        self.first_party = tuple(first_party)
+        self.blocked = 0
+        self.allowed = 0
+
+    def _decide(self, route):
+        request = route.request
+        if should_block(request.url, request.resource_type, self.first_party):
+            self.blocked += 1
+            return True
+        self.allowed += 1
+        return False
+
+    def handle(self, route):
+        if self._decide(route):
+            route.abort()
+        else:
+            route.continue_()
+
+    async def handle_async(self, route):
+        if self._decide(route):
+            await route.abort()
+        else:
+            await route.continue_()
+
+    def summary(self):
+        return f"blocked {self.blocked} requests, allowed {self.allowed}"
+
+
+def install_resource_filter(context, first_party):
+    """Install a ResourceFilter on a sync-API browser context (no-op when BLOCK_RESOURCES is off)."""
+    if not BLOCK_RESOURCES:
+        return None
+    rf = ResourceFilter(first_party)
+    context.route("**/*", rf.handle)
+    return rf
+
+
+async def install_resource_filter_async(context, first_party):
+    """Async-API counterpart of install_resource_filter."""
+    if not BLOCK_RESOURCES:
+        return None
+    rf = ResourceFilter(first_party)
+    await context.route("**/*", rf.handle_async)
+    return rf
+
+
+# Readiness waits: return as soon as the content the scraper reads is in the DOM,
+# instead of sleeping a fixed amount after navigation.
+READY_TIMEOUT_MS = int(os.getenv("READY_TIMEOUT_MS", "15000"))
+IDLE_TIMEOUT_MS = int(os.getenv("IDLE_TIMEOUT_MS", "5000"))
+
+
+def wait_until_ready(page, selector, timeout=READY_TIMEOUT_MS, idle_timeout=IDLE_TIMEOUT_MS):
+    """Wait until selector is attached to the DOM; if it never shows up, settle for
+    network idle. Returns True when the selector was found."""
+    try:
+        page.wait_for_selector(selector, state="attached", timeout=timeout)
+        return True
+    except Exception:
+        logger.info("Selector %r not ready after %d ms; waiting for network idle", selector, timeout)
+    try:
+        page.wait_for_load_state("networkidle", timeout=idle_timeout)
+    except Exception:
+        pass
+    return False
+
+
+async def wait_until_ready_async(page, selector, timeout=READY_TIMEOUT_MS, idle_timeout=IDLE_TIMEOUT_MS):
+    """Async-API counterpart of wait_until_ready."""
+    try:
+        await page.wait_for_selector(selector, state="attached", timeout=timeout)
+        return True
+    except Exception:
+        logger.info("Selector %r not ready after %d ms; waiting for network idle", selector, timeout)
+    try:
+        await page.wait_for_load_state("networkidle", timeout=idle_timeout)
+    except Exception:
+        pass
+    return False
+
+
+# Storage-state cache: cookies/localStorage (cf_clearance, age confirmation) saved after a
+# successful run and loaded into the next browser context to skip the challenge round-trip.
+STATE_MAX_AGE_HOURS = float(os.getenv("BROWSER_STATE_MAX_AGE_HOURS", "72"))
+
+
+def load_storage_state(path, max_age_hours=STATE_MAX_AGE_HOURS):
+    """Return a storage_state dict for browser.new_context, or None for a cold start.
+    Expired cookies are dropped; a stale file or one with no live cookies is ignored.
+    """
+    try:
+        age_hours = (time.time() - os.path.getmtime(path)) / 3600
+        with open(path, "r", encoding="utf-8") as f:
+            state = json.load(f)
+    except FileNotFoundError:
+        return None
+    except Exception:
+        logger.exception("Failed to read browser state %s", path)
+        return None
+    if age_hours > max_age_hours:
+        logger.info("Browser state %s is %.1f h old; starting cold", path, age_hours)
+        return None
+    now = time.time()
+    # session cookies carry expires=-1; keep those
+    cookies = [c for c in state.get("cookies", []) if c.get("expires", -1) <= 0 or c["expires"] > now]
+    if not cookies:
+        logger.info("All cookies in browser state %s expired; starting cold", path)
+        return None
+    state["cookies"] = cookies
+    return state
+
+
+def save_storage_state(context, path):
+    """Persist a sync-API context's cookies/localStorage after a successful run."""
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        context.storage_state(path=path)
+    except Exception:
+        logger.exception("Failed to save browser state to %s", path)
+
+
+async def save_storage_state_async(context, path):
+    """Async-API counterpart of save_storage_state."""
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        await context.storage_state(path=path)
+    except Exception:
+        logger.exception("Failed to save browser state to %s", path)
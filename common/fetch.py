@@ -0,0 +1,191 @@
+"""Tiered page fetching: plain HTTP first, a headless browser only when needed.
+
+The HTTP tier uses cloudscraper (or a plain requests Session when it is not
+installed) with the cookies saved by the last browser run, so a still-valid
+Cloudflare clearance is reused without starting Chromium. A caller-supplied
+check decides whether the response really contains the expected page; if not,
+the caller escalates to Playwright. Which tier served each run is logged and
+counted in a small JSON file next to the bot's data (kept in the Actions cache,
+not committed, since it changes every run).
+
+get_with_retry and HostLimiter are for scrapers that fetch many pages of one
+site concurrently: transient Cloudflare/5xx answers are retried with backoff,
+and the number of requests in flight per host is capped.
+"""
+import json
+import logging
+import os
+import random
+import threading
+import time
+from urllib.parse import urlparse
+
+import requests
+
+try:
+    import cloudscraper
+except Exception:
+    cloudscraper = None
+
+logger = logging.getLogger(__name__)
+
+HTTP_TIMEOUT = float(os.getenv("HTTP_FETCH_TIMEOUT", "15"))
+# set to false to always go straight to the browser
+HTTP_FIRST = os.getenv("HTTP_FIRST", "true").lower() in ("1", "true", "yes")
+
+# answers worth retrying: rate limiting, origin/5xx errors and Cloudflare's 52x codes
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504, 520, 521, 522, 523, 524})
+# a 403 is only transient when it is Cloudflare's challenge page, not a real denial
+CHALLENGE_MARKERS = ("Just a moment...", "cf-chl-", "challenge-platform")
+FETCH_ATTEMPTS = int(os.getenv("FETCH_ATTEMPTS", "3"))
+FETCH_BACKOFF = float(os.getenv("FETCH_BACKOFF", "2"))
+MAX_RETRY_DELAY = 60
+
+# returned by fetch_http for a 304: the page has not changed since the last run
+NOT_MODIFIED = object()
+
+
+def make_http_session(user_agent=None):
+    sess = cloudscraper.create_scraper() if cloudscraper else requests.Session()
+    if user_agent:
+        # cf_clearance is bound to the user agent that solved the challenge
+        sess.headers["User-Agent"] = user_agent
+    return sess
+
+
+def load_state_cookies(sess, state_path):
+    """Copy the cookies of a Playwright storage-state file into a requests session."""
+    try:
+        with open(state_path, "r", encoding="utf-8") as f:
+            state = json.load(f)
+    except FileNotFoundError:
+        return 0
+    except Exception:
+        logger.exception("Failed to read cookies from %s", state_path)
+        return 0
+    now = time.time()
+    count = 0
+    for c in state.get("cookies", []):
+        expires = c.get("expires", -1)
+        if expires > 0 and expires < now:
+            continue
+        sess.cookies.set(c["name"], c["value"], domain=c.get("domain"), path=c.get("path", "/"))
+        count += 1
+    return count
+
+
+class TieredFetcher:
+    """HTTP tier of a scraper; the browser tier stays in the bot."""
+
+    def __init__(self, state_path=None, user_agent=None):
+        self.session = make_http_session(user_agent)
+        if state_path:
+            n = load_state_cookies(self.session, state_path)
+            logger.debug("Loaded %d cookies from %s", n, state_path)
+
+    def fetch_http(self, url, validate, headers=None, cache=None):
+        """GET url over plain HTTP. Returns the HTML when the response is a 200 and
+        validate(html) is true, otherwise None (the caller should use the browser).
+        With a ListingCache the request is conditional and a 304 returns NOT_MODIFIED."""
+        if not HTTP_FIRST:
+            return None
+        if cache is not None:
+            headers = {**(headers or {}), **cache.conditional_headers(url)}
+        try:
+            resp = self.session.get(url, timeout=HTTP_TIMEOUT, headers=headers)
+        except Exception as e:
+            logger.info("HTTP fetch of %s failed (%s); escalating to browser", url, e)
+            return None
+        if resp.status_code == 304 and cache is not None:
+            return NOT_MODIFIED
+        if resp.status_code != 200:
+            logger.info("HTTP fetch of %s returned %s; escalating to browser", url, resp.status_code)
+            return None
+        html = resp.text
+        if not validate(html):
+            logger.info("HTTP fetch of %s lacks the expected content; escalating to browser", url)
+            return None
+        if cache is not None:
+            cache.update_validators(url, resp)
+        return html
+
+
+def is_transient(resp):
+    """True if resp looks like a temporary failure (overload or a Cloudflare challenge)."""
+    if resp.status_code in RETRY_STATUSES:
+        return True
+    if resp.status_code == 403:
+        # Cloudflare also serves real bans and forbidden pages as 403s; only its challenge is worth retrying
+        return any(m in resp.text for m in CHALLENGE_MARKERS)
+    return False
+
+
+def _retry_delay(resp, attempt, backoff):
+    header = resp.headers.get("Retry-After") if resp is not None else None
+    if header:
+        try:
+            return min(float(header), MAX_RETRY_DELAY)
+        except ValueError:
+            pass
+    # exponential backoff with jitter so parallel workers do not retry in lockstep
+    return min(backoff * 2 ** (attempt - 1), MAX_RETRY_DELAY) + random.uniform(0, backoff)
+
+
+def get_with_retry(sess, url, attempts=None, backoff=None, **kwargs):
+    """GET url, retrying connection errors and transient responses (see is_transient)
+    with exponential backoff. Returns the last response; re-raises the last error."""
+    attempts = attempts or FETCH_ATTEMPTS
+    backoff = FETCH_BACKOFF if backoff is None else backoff
+    for attempt in range(1, attempts + 1):
+        resp = None
+        try:
+            resp = sess.get(url, **kwargs)
+        except Exception as e:
+            # cloudscraper raises its own (non-requests) errors for unsolved challenges
+            if attempt == attempts:
+                raise
+            logger.info("GET %s failed (%s); attempt %d/%d", url, e, attempt, attempts)
+        else:
+            if not is_transient(resp) or attempt == attempts:
+                return resp
+            logger.info("GET %s returned %s; attempt %d/%d", url, resp.status_code, attempt, attempts)
+        time.sleep(_retry_delay(resp, attempt, backoff))
+
+
+class HostLimiter:
+    """Hands out one shared semaphore per host to cap concurrent requests to it."""
+
+    def __init__(self, limit):
+        self.limit = max(1, limit)
+        self._semaphores = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, url):
+        host = urlparse(url).netloc.lower()
+        with self._lock:
+            sem = self._semaphores.get(host)
+            if sem is None:
+                sem = threading.BoundedSemaphore(self.limit)
+                self._semaphores[host] = sem
+        return sem
+
+
+def record_tier(path, tier):
+    """Log which tier served this run and keep per-tier counts in path."""
+    logger.info("Fetch tier used this run: %s", tier)
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            stats = json.load(f)
+    except Exception:
+        stats = {}
+    counts = stats.setdefault("counts", {})
+    counts[tier] = counts.get(tier, 0) + 1
+    stats["last_tier"] = tier
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(stats, f, indent=2)
+        os.replace(tmp, path)
+    except Exception:
+        logger.exception("Failed to record fetch tier to %s", path)
@@ -0,0 +1,105 @@
+"""Change detection for listing pages fetched every run.
+
+For each listing URL the cache keeps the server's validators (ETag and
+Last-Modified) and a SHA-256 fingerprint of the part of the page the bot reads.
+The next request is made conditional on the validators; a 304, or a 200 whose
+fingerprint matches the stored one, lets the bot stop before parsing the items
+or fetching any detail page. New values are only written by save() (or
+finish()), which the bot calls at the end of a run, so a run that fails half-way
+is repeated.
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+def fingerprint(content):
+    if isinstance(content, str):
+        content = content.encode("utf-8")
+    return hashlib.sha256(content).hexdigest()
+
+
+class ListingCache:
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        self.lock = threading.Lock()
+        self.dirty = False
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        except Exception:
+            logger.exception("Failed to read listing cache %s; starting empty", self.path)
+            return
+        if isinstance(data, dict):
+            self.entries = {url: entry for url, entry in data.items() if isinstance(entry, dict)}
+
+    def conditional_headers(self, url):
+        """If-None-Match / If-Modified-Since headers for the stored validators of url."""
+        entry = self.entries.get(url) or {}
+        headers = {}
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def update_validators(self, url, resp):
+        """Remember the ETag/Last-Modified of a 200 response for the next run."""
+        etag = resp.headers.get("ETag")
+        last_modified = resp.headers.get("Last-Modified")
+        with self.lock:
+            entry = self.entries.setdefault(url, {})
+            if entry.get("etag") != etag or entry.get("last_modified") != last_modified:
+                entry["etag"] = etag
+                entry["last_modified"] = last_modified
+                self.dirty = True
+
+    def unchanged(self, url, content):
+        """True if content fingerprints the same as last run; otherwise remember it."""
+        digest = fingerprint(content)
+        with self.lock:
+            entry = self.entries.setdefault(url, {})
+            if entry.get("fingerprint") == digest:
+                return True
+            entry["fingerprint"] = digest
+            self.dirty = True
+            return False
+
+    def invalidate(self, url):
+        """Forget everything about url so the next run processes the listing again."""
+        with self.lock:
+            if self.entries.pop(url, None) is not None:
+                self.dirty = True
+
+    def finish(self, url, all_sent=True):
+        """End a run over url's listing and save. Unless every listed item was sent,
+        url is forgotten first: the unsent items are retried next run, so an
+        unchanged listing must not be skipped then."""
+        if not all_sent:
+            self.invalidate(url)
+        self.save()
+
+    def save(self):
+        with self.lock:
+            if not self.dirty:
+                return
+            data = dict(self.entries)
+            self.dirty = False
+        tmp = f"{self.path}.tmp"
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False, indent=1)
+            os.replace(tmp, self.path)
+        except Exception:
+            logger.exception("Failed to write listing cache %s", self.path)
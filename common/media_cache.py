@@ -0,0 +1,139 @@
+"""Persistent cache of Telegram file_ids for media that was already uploaded.
+
+Telegram returns a file_id for every uploaded photo/video/animation/document;
+sending that file_id again re-uses the stored file without any download or
+upload. Entries are keyed by a normalized media URL ("url:...") and by the
+SHA-256 of the downloaded bytes ("sha256:..."), kept in least-recently-used
+order, expire after a TTL and are capped in number.
+"""
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import urlparse
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_ENTRIES = 5000
+DEFAULT_TTL_SECONDS = 30 * 24 * 3600
+
+# hosts whose query string only carries signatures/resizing hints, not identity
+QUERYLESS_HOSTS = ("i.redd.it", "preview.redd.it", "external-preview.redd.it", "i.imgur.com")
+REDGIFS_ID_RE = re.compile(r"/(?:watch|ifr|gifs)/([A-Za-z0-9]+)")
+
+
+def normalize_media_url(url):
+    """Canonical form of a media URL so crossposts of the same file share a key."""
+    if not url:
+        return None
+    parsed = urlparse(url.strip())
+    host = parsed.netloc.lower()
+    if host.startswith("www."):
+        host = host[4:]
+    path = parsed.path or "/"
+    if "redgifs" in host:
+        m = REDGIFS_ID_RE.search(path)
+        if m:
+            return f"redgifs:{m.group(1).lower()}"
+    if host in QUERYLESS_HOSTS or not parsed.query:
+        return f"{host}{path}"
+    return f"{host}{path}?{parsed.query}"
+
+
+def file_sha256(path, chunk_size=1024 * 1024):
+    h = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for chunk in iter(lambda: fh.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def file_id_from_message(message, kind):
+    """Extract the file_id of the media `kind` ('photo', 'video', ...) from a sent Message."""
+    if not isinstance(message, dict):
+        return None
+    media = message.get(kind)
+    if kind == "photo" and isinstance(media, list) and media:
+        # photo sizes are sorted ascending; the last one is the original
+        return media[-1].get("file_id")
+    if isinstance(media, dict):
+        return media.get("file_id")
+    return None
+
+
+class FileIdCache:
+    """Thread-safe LRU/TTL map of cache key -> {"file_id", "kind", "ts"} persisted as JSON."""
+
+    def __init__(self, path, max_entries=DEFAULT_MAX_ENTRIES, ttl=DEFAULT_TTL_SECONDS):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.dirty = False
+        self.lock = threading.Lock()
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        except Exception:
+            logger.exception("Failed to read file_id cache %s; starting empty", self.path)
+            return
+        now = time.time()
+        # stored oldest-first, so insertion order is the LRU order
+        for key, entry in data.items():
+            if isinstance(entry, dict) and entry.get("file_id") and now - entry.get("ts", 0) < self.ttl:
+                self.entries[key] = entry
+
+    def get(self, key):
+        if not key:
+            return None
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            if time.time() - entry.get("ts", 0) >= self.ttl:
+                del self.entries[key]
+                self.dirty = True
+                return None
+            self.entries.move_to_end(key)
+            return entry
+
+    def put(self, key, file_id, kind):
+        if not key or not file_id:
+            return
+        with self.lock:
+            self.entries[key] = {"file_id": file_id, "kind": kind, "ts": time.time()}
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+            self.dirty = True
+
+    def discard(self, file_id):
+        """Drop every key pointing at file_id (e.g. after Telegram rejected it)."""
+        with self.lock:
+            stale = [k for k, e in self.entries.items() if e.get("file_id") == file_id]
+            for k in stale:
+                del self.entries[k]
+            self.dirty = self.dirty or bool(stale)
+
+    def save(self):
+        with self.lock:
+            if not self.dirty:
+                return
+            data = dict(self.entries)
+            self.dirty = False
+        tmp = f"{self.path}.tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False, indent=1)
+            os.replace(tmp, self.path)
+        except Exception:
+            logger.exception("Failed to write file_id cache %s", self.path)
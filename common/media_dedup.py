@@ -0,0 +1,175 @@
+"""Fingerprints of sent media, so reposts are caught before they are uploaded again.
+
+The same picture or clip often comes back under a different post and URL. A
+SHA-256 of the downloaded bytes catches identical files; a 64-bit difference
+hash (dHash) of the image, or of a frame from early in a video, also catches re-encodes,
+resizes and recompressions, which differ in a few bits at most. Both are kept
+per sent message in the bot's state store (source "media"), with the message id
+and Telegram file_id, so a match can reference the earlier message.
+
+Perceptual hashing needs Pillow, and ffmpeg on PATH for video frames; without
+them only the SHA-256 is used.
+"""
+import io
+import logging
+import mimetypes
+import os
+import shutil
+import subprocess
+import threading
+
+try:
+    from PIL import Image, ImageStat
+except Exception:
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+HASH_SIZE = 8
+# dHashes within this many differing bits (of 64) count as the same picture
+MAX_DISTANCE = int(os.getenv("PHASH_MAX_DISTANCE", "6"))
+# Near-uniform pictures (black/white frames, flat fills) hash to almost all 0 or 1
+# bits and would match each other; such hashes are not used. Both limits keep
+# rejected hashes further than MAX_DISTANCE from any accepted one.
+MIN_STDDEV = 8.0
+MIN_BITS = 2 * MAX_DISTANCE
+FFMPEG = shutil.which("ffmpeg")
+FRAME_TIMEOUT = 30
+# clips often open on a black or title frame: take a representative frame from
+# after this offset (the start, for shorter clips)
+FRAME_OFFSET = "1"
+
+
+def dhash(image, hash_size=HASH_SIZE):
+    """Difference hash: one bit per horizontally adjacent pixel pair of a tiny grayscale copy."""
+    resample = getattr(Image, "Resampling", Image).LANCZOS
+    small = image.convert("L").resize((hash_size + 1, hash_size), resample)
+    pixels = small.tobytes()
+    value = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for col in range(hash_size):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return value
+
+
+def hamming(a, b):
+    return bin(a ^ b).count("1")
+
+
+def informative(phash):
+    """False for hashes of near-uniform pictures, which match each other regardless of content."""
+    bits = bin(phash).count("1")
+    return MIN_BITS <= bits <= HASH_SIZE * HASH_SIZE - MIN_BITS
+
+
+def video_frame(path):
+    """A representative video frame of path (ffmpeg's thumbnail filter, after
+    FRAME_OFFSET, or from the start for clips shorter than that). Returns a PIL
+    image or None."""
+    if not FFMPEG:
+        return None
+    for seek in (["-ss", FRAME_OFFSET], []):
+        try:
+            proc = subprocess.run(
+                [FFMPEG, "-v", "error", *seek, "-i", path, "-vf", "thumbnail", "-frames:v", "1",
+                 "-f", "image2pipe", "-vcodec", "png", "-"],
+                capture_output=True, timeout=FRAME_TIMEOUT, check=True,
+            )
+        except Exception as e:
+            logger.debug("ffmpeg could not extract a frame from %s (seek %s): %s", path, seek, e)
+            continue
+        if proc.stdout:
+            return Image.open(io.BytesIO(proc.stdout))
+    return None
+
+
+def perceptual_hash(path, content_type=None):
+    """dHash of an image file or of a representative video frame; None if it cannot
+    be computed or the picture is too uniform to tell apart from others."""
+    if Image is None:
+        return None
+    ct = (content_type or mimetypes.guess_type(path)[0] or "").lower()
+    try:
+        if ct.startswith("video/"):
+            img = video_frame(path)
+            if img is None:
+                return None
+        else:
+            # animated images hash their first frame, which is what Image.open shows
+            img = Image.open(path)
+        with img:
+            if ImageStat.Stat(img.convert("L")).stddev[0] < MIN_STDDEV:
+                logger.debug("No perceptual hash for %s: picture is near-uniform", path)
+                return None
+            phash = dhash(img)
+    except Exception as e:
+        logger.debug("No perceptual hash for %s: %s", path, e)
+        return None
+    return phash if informative(phash) else None
+
+
+class MediaIndex:
+    """Persistent index of sent media by SHA-256 and perceptual hash."""
+
+    def __init__(self, store, source="media", max_distance=MAX_DISTANCE):
+        self.store = store
+        self.source = source
+        self.max_distance = max_distance
+        self.lock = threading.Lock()
+        # near matches need a scan; the hashes are small enough to keep in memory
+        self.phashes = {}
+        # file_id -> sha, so a file_id cache hit (same URL) also finds its message
+        self.file_ids = {}
+        for sha, data in store.records(source):
+            if not data:
+                continue
+            if data.get("phash") is not None and informative(data["phash"]):
+                self.phashes[sha] = data["phash"]
+            if data.get("file_id"):
+                self.file_ids[data["file_id"]] = sha
+
+    def lookup(self, sha, phash=None):
+        """The record of an earlier upload with the same bytes or a perceptually close
+        picture, or None."""
+        if sha:
+            record = self.store.get(self.source, sha)
+            if record:
+                return record
+        if phash is None or not informative(phash):
+            return None
+        with self.lock:
+            candidates = [(hamming(phash, other), s) for s, other in self.phashes.items()]
+        close = [c for c in candidates if c[0] <= self.max_distance]
+        if not close:
+            return None
+        distance, sha = min(close)
+        logger.debug("Perceptual match at distance %d", distance)
+        return self.store.get(self.source, sha)
+
+    def lookup_file_id(self, file_id):
+        """The record of the message that uploaded file_id, or None."""
+        with self.lock:
+            sha = self.file_ids.get(file_id)
+        return self.store.get(self.source, sha) if sha else None
+
+    def remember(self, sha, phash, message, kind, file_id=None):
+        """Record a sent message's media under its content hash."""
+        if not sha or not isinstance(message, dict):
+            return
+        if phash is not None and not informative(phash):
+            phash = None
+        record = {
+            "message_id": message.get("message_id"),
+            "chat_id": (message.get("chat") or {}).get("id"),
+            "chat_username": (message.get("chat") or {}).get("username"),
+            "kind": kind,
+            "file_id": file_id,
+            "phash": phash,
+        }
+        self.store.add(self.source, sha, record)
+        with self.lock:
+            if phash is not None:
+                self.phashes[sha] = phash
+            if file_id:
+                self.file_ids[file_id] = sha
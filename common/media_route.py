@@ -0,0 +1,124 @@
+"""Pick the downloader for a media URL before downloading anything.
+
+Most post URLs can be routed from the host and path alone: file URLs such as
+i.redd.it images and v.redd.it mp4s download directly, Redgifs watch links need the Redgifs API,
+YouTube/Streamable/imgur pages need yt-dlp. Anything else is probed once with a
+ranged GET for its first 2 KB, which tells an HTML page from media (checking
+both the Content-Type and the bytes) and yields the content type and total size
+for free. Routes are memoized per URL for the run.
+"""
+import logging
+import mimetypes
+import threading
+from collections import namedtuple
+from urllib.parse import urlparse
+
+from common.media_cache import REDGIFS_ID_RE
+
+logger = logging.getLogger(__name__)
+
+DIRECT = "direct"
+REDGIFS = "redgifs"
+YTDLP = "yt-dlp"
+
+# url may differ from the requested one (rewritten or redirected)
+Route = namedtuple("Route", "kind url content_type size")
+
+MEDIA_EXTENSIONS = (".jpg", ".jpeg", ".png", ".gif", ".webp", ".mp4", ".webm", ".mov", ".m4v")
+# page hosts yt-dlp has extractors for
+YTDLP_HOSTS = (
+    "v.redd.it", "youtube.com", "youtu.be", "streamable.com", "imgur.com", "gfycat.com",
+    "twitter.com", "x.com", "tiktok.com", "vimeo.com", "pornhub.com", "xvideos.com",
+)
+PROBE_BYTES = 2048
+
+
+def _host(url):
+    host = urlparse(url).netloc.lower().split(":")[0]
+    return host[4:] if host.startswith("www.") else host
+
+
+def _on(host, domains):
+    return any(host == d or host.endswith("." + d) for d in domains)
+
+
+def looks_like_html(head):
+    """Sniff the first bytes of a download for an HTML page served in place of media."""
+    text = head[:PROBE_BYTES].decode("utf-8", errors="ignore").lower()
+    return "<!doctype" in text or "<html" in text or "<script" in text
+
+
+def route_by_rules(url):
+    """Route from host and path alone, or None if the URL has to be probed."""
+    host = _host(url)
+    parsed = urlparse(url)
+    path = parsed.path
+    ext = ("." + path.rsplit(".", 1)[-1].lower()) if "." in path.rsplit("/", 1)[-1] else ""
+    if "redgifs" in host and host != "media.redgifs.com" and REDGIFS_ID_RE.search(path):
+        return Route(REDGIFS, url, None, None)
+    if host == "i.imgur.com" and ext == ".gifv":
+        # the .gifv page wraps the clip served as .mp4 at the same path
+        return Route(DIRECT, parsed._replace(path=path[:-len(ext)] + ".mp4").geturl(), "video/mp4", None)
+    if ext in MEDIA_EXTENSIONS:
+        # a file URL (including v.redd.it DASH mp4s); the download still sniffs for HTML
+        return Route(DIRECT, url, mimetypes.guess_type(path)[0], None)
+    if _on(host, YTDLP_HOSTS):
+        return Route(YTDLP, url, None, None)
+    return None
+
+
+class MediaRouter:
+    def __init__(self, session, user_agent=None):
+        self.session = session
+        self.user_agent = user_agent
+        self.routes = {}
+        self.lock = threading.Lock()
+
+    def route(self, url):
+        with self.lock:
+            cached = self.routes.get(url)
+        if cached:
+            return cached
+        route = route_by_rules(url) or self.probe(url)
+        logger.debug("Routed %s to %s", url, route.kind)
+        with self.lock:
+            self.routes[url] = route
+        return route
+
+    def content_type(self, url):
+        return self.route(url).content_type
+
+    def probe(self, url):
+        """Classify url from its first bytes. Unreachable URLs route DIRECT, whose
+        fallbacks still run."""
+        headers = {"Range": f"bytes=0-{PROBE_BYTES - 1}"}
+        if self.user_agent:
+            headers["User-Agent"] = self.user_agent
+        try:
+            with self.session.get(url, headers=headers, stream=True, allow_redirects=True, timeout=10) as resp:
+                if resp.status_code not in (200, 206):
+                    logger.debug("Probe of %s returned %s", url, resp.status_code)
+                    return Route(DIRECT, url, None, None)
+                content_type = (resp.headers.get("Content-Type") or "").split(";")[0].strip().lower() or None
+                head = b""
+                for chunk in resp.iter_content(chunk_size=PROBE_BYTES):
+                    head += chunk
+                    if len(head) >= PROBE_BYTES:
+                        break
+                final_url = resp.url or url
+                size = None
+                content_range = resp.headers.get("Content-Range") or ""
+                if "/" in content_range and content_range.rsplit("/", 1)[1].isdigit():
+                    size = int(content_range.rsplit("/", 1)[1])
+                elif resp.status_code == 200 and (resp.headers.get("Content-Length") or "").isdigit():
+                    size = int(resp.headers["Content-Length"])
+        except Exception as e:
+            logger.debug("Probe of %s failed: %s", url, e)
+            return Route(DIRECT, url, None, None)
+        if (content_type or "").startswith(("text/html", "application/xhtml+xml")) or looks_like_html(head):
+            # a page: follow where it redirected to, if that is a known host
+            rule = route_by_rules(final_url)
+            if rule and rule.kind != DIRECT:
+                return rule
+            return Route(YTDLP, url, content_type, None)
+        return Route(DIRECT, url, content_type, size)
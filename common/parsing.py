@@ -0,0 +1,35 @@
+"""HTML parsing helpers shared by the scrapers.
+
+make_soup parses with the fastest BeautifulSoup backend installed (lxml, else
+the stdlib html.parser) and can restrict the tree to the containers a bot
+actually reads via a SoupStrainer, which skips building the rest of the page.
+"""
+import os
+import re
+
+from bs4 import BeautifulSoup
+
+try:
+    import lxml  # noqa: F401 - only probing availability
+    DEFAULT_PARSER = "lxml"
+except Exception:
+    DEFAULT_PARSER = "html.parser"
+
+PARSER = os.getenv("HTML_PARSER", DEFAULT_PARSER)
+# set to false to always build the full tree (e.g. to debug a selector)
+PARTIAL_PARSING = os.getenv("PARTIAL_PARSING", "true").lower() in ("1", "true", "yes")
+
+
+def has_class(name):
+    """Strainer attribute matcher for one CSS class.
+    While parsing, newer bs4 versions hand the strainer the raw class attribute
+    ("container index-popular"), so match a whole word instead of the exact value.
+    """
+    return re.compile(r"(^|\s)" + re.escape(name) + r"(\s|$)")
+
+
+def make_soup(html, only=None):
+    """Parse html with the configured backend, keeping only elements matching `only`."""
+    if only is not None and PARTIAL_PARSING:
+        return BeautifulSoup(html, PARSER, parse_only=only)
+    return BeautifulSoup(html, PARSER)
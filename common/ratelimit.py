@@ -0,0 +1,159 @@
+"""Token-bucket rate limiting for Telegram Bot API calls.
+
+Telegram allows roughly 30 messages per second per bot, 1 message per second
+to a single private chat and 20 messages per minute to a group or channel.
+Every send goes through a global bucket and a per-chat bucket sized to those
+limits, and 429 responses are retried after the ``retry_after`` Telegram
+returns instead of relying on fixed sleeps between messages.
+"""
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+GLOBAL_RATE = float(os.getenv("TELEGRAM_GLOBAL_RATE", "30"))
+PRIVATE_CHAT_RATE = float(os.getenv("TELEGRAM_CHAT_RATE", "1"))
+GROUP_CHAT_RATE = float(os.getenv("TELEGRAM_GROUP_RATE", str(20 / 60.0)))
+# small burst allowance for groups/channels; the long-run rate stays at 20/min
+GROUP_CHAT_BURST = float(os.getenv("TELEGRAM_GROUP_BURST", "3"))
+
+MAX_ATTEMPTS = 5
+
+
+class TokenBucket:
+    """Thread-safe token bucket. acquire() blocks until the tokens are available."""
+
+    def __init__(self, rate, capacity):
+        self.rate = float(rate)
+        self.capacity = max(1.0, float(capacity))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.lock = threading.Lock()
+
+    def _refill(self, now):
+        elapsed = now - self.updated
+        if elapsed > 0:
+            self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+            self.updated = now
+
+    def acquire(self, tokens=1):
+        """Take tokens from the bucket, sleeping as long as needed.
+        Requests larger than the capacity (e.g. a 10 item album) run the bucket into debt.
+        """
+        needed = min(float(tokens), self.capacity)
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self._refill(now)
+                wait = self.paused_until - now
+                if wait <= 0:
+                    if self.tokens >= needed:
+                        self.tokens -= tokens
+                        return
+                    wait = (needed - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def pause(self, seconds):
+        """Block all acquires for the given number of seconds, then allow a single send."""
+        with self.lock:
+            now = time.monotonic()
+            self.paused_until = max(self.paused_until, now + seconds)
+            self.tokens = 1.0
+            self.updated = self.paused_until
+
+
+def is_group_chat(chat_id):
+    """Groups, supergroups and channels have negative ids or an @username."""
+    text = str(chat_id).strip()
+    return text.startswith("-") or text.startswith("@")
+
+
+class TelegramRateLimiter:
+    """Global plus per-chat token buckets matching Telegram's flood limits."""
+
+    def __init__(self, global_rate=GLOBAL_RATE, chat_rate=PRIVATE_CHAT_RATE,
+                 group_rate=GROUP_CHAT_RATE, group_burst=GROUP_CHAT_BURST):
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.chat_rate = chat_rate
+        self.group_rate = group_rate
+        self.group_burst = group_burst
+        self.chat_buckets = {}
+        self.lock = threading.Lock()
+
+    def bucket_for(self, chat_id):
+        key = str(chat_id)
+        with self.lock:
+            bucket = self.chat_buckets.get(key)
+            if bucket is None:
+                if is_group_chat(chat_id):
+                    bucket = TokenBucket(self.group_rate, self.group_burst)
+                else:
+                    bucket = TokenBucket(self.chat_rate, 1)
+                self.chat_buckets[key] = bucket
+        return bucket
+
+    def acquire(self, chat_id, cost=1):
+        """Wait until a message costing `cost` may be sent to chat_id."""
+        if chat_id is not None:
+            self.bucket_for(chat_id).acquire(cost)
+        self.global_bucket.acquire(cost)
+
+    def backoff(self, chat_id, seconds):
+        """Honour a retry_after from Telegram for chat_id (or globally when chat_id is None)."""
+        if chat_id is not None:
+            self.bucket_for(chat_id).pause(seconds)
+        else:
+            self.global_bucket.pause(seconds)
+
+
+def parse_retry_after(resp):
+    """Return the retry_after seconds of a 429 response, or None if it has none."""
+    try:
+        params = (resp.json() or {}).get("parameters") or {}
+        if params.get("retry_after") is not None:
+            return float(params["retry_after"])
+    except Exception:
+        pass
+    header = resp.headers.get("Retry-After") if getattr(resp, "headers", None) else None
+    if header:
+        try:
+            return float(header)
+        except ValueError:
+            return None
+    return None
+
+
+default_limiter = TelegramRateLimiter()
+
+
+def send_with_retry(do_request, chat_id, cost=1, limiter=None, max_attempts=MAX_ATTEMPTS, retry_server_errors=True):
+    """Call do_request() under the rate limiter, retrying 429 and (with
+    retry_server_errors) 5xx responses.
+
+    do_request must perform one complete HTTP request (re-opening any files it
+    uploads) and return the response; it is called again for every retry.
+    Returns the last response. Exceptions from do_request propagate.
+    """
+    limiter = limiter or default_limiter
+    resp = None
+    for attempt in range(max_attempts):
+        limiter.acquire(chat_id, cost)
+        resp = do_request()
+        status = resp.status_code
+        if status == 429:
+            wait = parse_retry_after(resp)
+            if wait is None:
+                wait = 2 ** attempt
+            logger.warning("Telegram rate limited chat %s; retrying in %.1fs", chat_id, wait)
+            limiter.backoff(chat_id, wait)
+            continue
+        if retry_server_errors and 500 <= status < 600 and attempt + 1 < max_attempts:
+            wait = 2 ** attempt
+            logger.warning("Telegram returned %s; retrying in %ds", status, wait)
+            time.sleep(wait)
+            continue
+        return resp
+    return resp
@@ -0,0 +1,114 @@
+"""Long-lived Redgifs API client.
+
+Every Redgifs clip needs an API call to learn its media URLs, and the API
+wants a bearer token from /v2/auth/temporary. One client per run reuses the
+token until shortly before its "exp" claim, caches the candidate media URLs of
+each gif id for a while, and remembers which URL field last downloaded fine,
+so the next clip can try that field first without probing it.
+"""
+import base64
+import json
+import logging
+import threading
+import time
+
+try:
+    import redgifs
+except Exception:
+    redgifs = None
+
+logger = logging.getLogger(__name__)
+
+# media URL fields of a gif, best first; web/embed URLs are pages, poster/thumbnails stills
+CANDIDATE_FIELDS = ("hd", "sd", "file_url")
+# media URLs carry signatures that expire, so resolved URLs are only reused for a while
+URL_TTL = 3600
+# refresh the token this long before it expires
+TOKEN_MARGIN = 300
+# lifetime assumed for a token without a readable "exp" claim
+DEFAULT_TOKEN_TTL = 3600
+
+
+def token_expiry(token, default_ttl=DEFAULT_TOKEN_TTL):
+    """Expiry time of a JWT bearer token, from its unverified "exp" claim."""
+    try:
+        payload = token.split(".")[1]
+        payload += "=" * (-len(payload) % 4)
+        return float(json.loads(base64.urlsafe_b64decode(payload))["exp"])
+    except Exception:
+        return time.time() + default_ttl
+
+
+class RedgifsClient:
+    def __init__(self, url_ttl=URL_TTL):
+        self.url_ttl = url_ttl
+        self.api = None
+        self.token_expires = 0.0
+        self.lock = threading.Lock()
+        # gif_id -> (expires, [(field, url), ...])
+        self.urls = {}
+        # the candidate field that last downloaded fine
+        self.good_field = None
+
+    def _login(self, force=False):
+        with self.lock:
+            if self.api is None:
+                self.api = redgifs.API()
+            if force or time.time() >= self.token_expires - TOKEN_MARGIN:
+                self.api.login()
+                token = self.api.http.headers.get("authorization", "").split(" ")[-1]
+                self.token_expires = token_expiry(token)
+                logger.debug("Fetched Redgifs token valid until %s", time.ctime(self.token_expires))
+            return self.api
+
+    def _call(self, fn):
+        """Run fn(api) with a valid token, fetching a new one once if the call is rejected."""
+        api = self._login()
+        try:
+            return fn(api)
+        except Exception as e:
+            if getattr(e, "status", None) not in (401, 403):
+                raise
+            logger.info("Redgifs rejected the cached token (%s); logging in again", e.status)
+            return fn(self._login(force=True))
+
+    def media_urls(self, gif_id):
+        """Candidate media URLs of gif_id as [(field, url)], best first."""
+        now = time.time()
+        with self.lock:
+            cached = self.urls.get(gif_id)
+            if cached and cached[0] > now:
+                return list(cached[1])
+        gif = self._call(lambda api: api.get_gif(gif_id))
+        urls = getattr(gif, "urls", None)
+        candidates = []
+        for field in CANDIDATE_FIELDS:
+            url = getattr(urls, field, None)
+            if url and url not in (u for _, u in candidates):
+                candidates.append((field, url))
+        with self.lock:
+            good = self.good_field
+            candidates.sort(key=lambda c: c[0] != good)
+            self.urls[gif_id] = (now + self.url_ttl, candidates)
+        return list(candidates)
+
+    def download(self, url, path):
+        return self._call(lambda api: api.download(url, path))
+
+    def worked(self, gif_id, field):
+        """Note that field of gif_id downloaded fine: try it first from now on."""
+        with self.lock:
+            self.good_field = field
+            cached = self.urls.get(gif_id)
+            if cached:
+                cached[1].sort(key=lambda c: c[0] != field)
+
+    def close(self):
+        with self.lock:
+            if self.api is not None:
+                try:
+                    self.api.close()
+                except Exception:
+                    pass
+            self.api = None
+            self.token_expires = 0.0
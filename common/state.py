@@ -0,0 +1,418 @@
+"""Persistent "already sent" state for the bots, kept in SQLite.
+
+Each bot has one database in its data directory with a seen(source, id) table;
+the primary key doubles as the index, so membership checks are a single lookup
+and marking an item as sent is a single-row insert made right after the send,
+instead of rewriting a whole JSON file. The database runs in WAL mode and is
+checkpointed back into the main file on close(), so only state.db has to be
+committed by the workflows.
+
+Opening a store does not touch the JSON files the bots used before;
+migrate_json imports one of them once and then removes it.
+
+Every row carries the time it was last seen, so prune() evicts by age and by
+count in true least-recently-seen order, and touch() keeps ids that are still
+listed from ageing out. Ids of sources with a compact encoding (base-36 Reddit
+ids) are stored as integers.
+
+Every id ever added also goes into a scalable Bloom filter (common.bloom) kept
+in the same database. It answers most "not seen" lookups without touching the
+table, and it outlives prune(): for a source that has been pruned, an id missing
+from the table but present in the filter was evicted, not new, and still counts
+as seen (wrong only at the filter's ~1e-4 false-positive rate). The filter is
+written back on close(); after an unclean exit it is rebuilt from the last saved
+copy plus the seen table.
+
+A run that changes nothing leaves the database file byte-for-byte unchanged, so
+the workflows only commit it when something was sent, pruned or migrated: the
+"filter out of date" marker is only written once a run first adds an id, and
+close() only saves and checkpoints when the run wrote anything.
+"""
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+
+from common.bloom import BloomFilter, ScalableBloomFilter
+
+logger = logging.getLogger(__name__)
+
+# id has no declared type so packed ids stay INTEGER (a varint) instead of text
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS seen (
+    source TEXT NOT NULL,
+    id NOT NULL,
+    ts REAL NOT NULL,
+    data TEXT,
+    PRIMARY KEY (source, id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS seen_by_age ON seen (source, ts);
+CREATE TABLE IF NOT EXISTS migrations (
+    name TEXT PRIMARY KEY,
+    ts REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS bloom (
+    idx INTEGER PRIMARY KEY,
+    capacity INTEGER NOT NULL,
+    error_rate REAL NOT NULL,
+    count INTEGER NOT NULL,
+    bits BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS meta (
+    name TEXT PRIMARY KEY,
+    value
+);
+"""
+
+BASE36_RE = re.compile(r"^[0-9a-z]+$")
+BASE36_DIGITS = "0123456789abcdefghijklmnopqrstuvwxyz"
+
+
+def pack_base36(item_id):
+    """Reddit-style base-36 id -> int; anything else is returned unchanged."""
+    if isinstance(item_id, str) and BASE36_RE.match(item_id):
+        return int(item_id, 36)
+    return item_id
+
+
+def unpack_base36(value):
+    if not isinstance(value, int):
+        return value
+    digits = []
+    while True:
+        value, rem = divmod(value, 36)
+        digits.append(BASE36_DIGITS[rem])
+        if not value:
+            return "".join(reversed(digits))
+
+
+def _key(item_id):
+    return item_id if isinstance(item_id, int) else str(item_id)
+
+
+def _history_key(source, item_id):
+    return f"{source}\x1f{_key(item_id)}"
+
+
+class StateStore:
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # autocommit: every add() is its own (tiny) transaction
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.lock = threading.Lock()
+        with self.lock:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+            self.conn.executescript(SCHEMA)
+            self.history = self._load_history()
+            self.pruned = {
+                name.split(":", 1)[1]
+                for (name,) in self.conn.execute("SELECT name FROM meta WHERE name LIKE 'pruned:%'")
+            }
+            # new source -> the source it was renamed from, whose history it inherits
+            self.renamed = {
+                name.split(":", 1)[1]: value
+                for name, value in self.conn.execute("SELECT name, value FROM meta WHERE name LIKE 'renamed:%'")
+            }
+
+    def _load_history(self):
+        rows = self.conn.execute(
+            "SELECT capacity, error_rate, count, bits FROM bloom ORDER BY idx"
+        ).fetchall()
+        history = ScalableBloomFilter(slices=[BloomFilter(c, e, bits, n) for c, e, n, bits in rows])
+        synced = self.conn.execute("SELECT value FROM meta WHERE name = 'bloom_synced'").fetchone()
+        # whether the saved filter covers every row of seen; kept in memory until it stops being true
+        self.synced = bool(synced and synced[0])
+        if not self.synced:
+            # first open, or the last run did not close(): make sure every row is covered
+            for source, item_id in self.conn.execute("SELECT source, id FROM seen"):
+                history.add(_history_key(source, item_id))
+        return history
+
+    def _mark_unsynced(self):
+        """Record that the saved filter is about to miss ids, before the first of them is
+        written; _save_history() clears it again, so it is only still set after an unclean exit."""
+        if self.synced:
+            self.conn.execute("INSERT OR REPLACE INTO meta (name, value) VALUES ('bloom_synced', 0)")
+            self.synced = False
+
+    def _save_history(self):
+        if self.synced and not self.history.dirty:
+            return
+        rows = [
+            (i, sl.capacity, sl.error_rate, sl.count, bytes(sl.bits))
+            for i, sl in enumerate(self.history.slices) if i in self.history.dirty
+        ]
+        self.conn.execute("BEGIN")
+        try:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO bloom (idx, capacity, error_rate, count, bits) VALUES (?, ?, ?, ?, ?)",
+                rows,
+            )
+            self.conn.execute("INSERT OR REPLACE INTO meta (name, value) VALUES ('bloom_synced', 1)")
+            self.conn.execute("COMMIT")
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+        self.history.dirty.clear()
+        self.synced = True
+
+    def in_history(self, source, item_id):
+        """True if item_id was evicted from source by prune() (see module docstring)."""
+        with self.lock:
+            for src in (source, self.renamed.get(source)):
+                if src in self.pruned and _history_key(src, item_id) in self.history:
+                    return True
+            return False
+
+    def contains(self, source, item_id):
+        with self.lock:
+            if _history_key(source, item_id) not in self.history:
+                # never added: no need to look at the table
+                return False
+            row = self.conn.execute(
+                "SELECT 1 FROM seen WHERE source = ? AND id = ?", (source, _key(item_id))
+            ).fetchone()
+        return row is not None
+
+    def add(self, source, item_id, data=None):
+        """Mark item_id of source as seen, optionally with a JSON-serializable record."""
+        payload = json.dumps(data, ensure_ascii=False) if data is not None else None
+        with self.lock:
+            self._mark_unsynced()
+            self.conn.execute(
+                "INSERT OR REPLACE INTO seen (source, id, ts, data) VALUES (?, ?, ?, ?)",
+                (source, _key(item_id), time.time(), payload),
+            )
+            self.history.add(_history_key(source, item_id))
+
+    def get(self, source, item_id):
+        """The record stored with item_id, or None."""
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT data FROM seen WHERE source = ? AND id = ?", (source, _key(item_id))
+            ).fetchone()
+        return json.loads(row[0]) if row and row[0] else None
+
+    def ids(self, source):
+        """All seen ids of source as a set (one query, for bulk diffing)."""
+        with self.lock:
+            rows = self.conn.execute("SELECT id FROM seen WHERE source = ?", (source,)).fetchall()
+        return {r[0] for r in rows}
+
+    def records(self, source):
+        """[(id, record)] of source; record is None for ids stored without data."""
+        with self.lock:
+            rows = self.conn.execute("SELECT id, data FROM seen WHERE source = ?", (source,)).fetchall()
+        return [(i, json.loads(d) if d else None) for i, d in rows]
+
+    def count(self, source):
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM seen WHERE source = ?", (source,)).fetchone()[0]
+
+    def touch(self, source, item_ids):
+        """Refresh the last-seen time of ids that are still around (e.g. still listed)."""
+        now = time.time()
+        with self.lock:
+            self.conn.executemany(
+                "UPDATE seen SET ts = ? WHERE source = ? AND id = ?",
+                [(now, source, _key(i)) for i in item_ids],
+            )
+
+    def prune(self, source, max_entries=None, max_age=None):
+        """Evict the least recently seen ids of source: those older than max_age
+        seconds, then the oldest beyond max_entries. Returns the number removed."""
+        removed = 0
+        with self.lock:
+            if max_age:
+                cur = self.conn.execute(
+                    "DELETE FROM seen WHERE source = ? AND ts < ?", (source, time.time() - max_age)
+                )
+                removed += cur.rowcount
+            if max_entries:
+                cur = self.conn.execute(
+                    "DELETE FROM seen WHERE source = ? AND id IN ("
+                    " SELECT id FROM seen WHERE source = ? ORDER BY ts DESC LIMIT -1 OFFSET ?)",
+                    (source, source, max_entries),
+                )
+                removed += cur.rowcount
+            if removed and source not in self.pruned:
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO meta (name, value) VALUES (?, ?)", (f"pruned:{source}", time.time())
+                )
+                self.pruned.add(source)
+        return removed
+
+    def repack(self, source, pack):
+        """Re-key the text ids of source that pack() turns into integers (one-time upgrade)."""
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT id, ts, data FROM seen WHERE source = ? AND typeof(id) = 'text'", (source,)
+            ).fetchall()
+            moves = [(old, pack(old), ts, data) for old, ts, data in rows]
+            moves = [m for m in moves if isinstance(m[1], int)]
+            if not moves:
+                return 0
+            self._mark_unsynced()
+            self.conn.execute("BEGIN")
+            try:
+                self.conn.executemany(
+                    "INSERT OR IGNORE INTO seen (source, id, ts, data) VALUES (?, ?, ?, ?)",
+                    [(source, new, ts, data) for old, new, ts, data in moves],
+                )
+                self.conn.executemany(
+                    "DELETE FROM seen WHERE source = ? AND id = ?", [(source, m[0]) for m in moves]
+                )
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+            for old, new, ts, data in moves:
+                self.history.add(_history_key(source, new))
+        return len(moves)
+
+    def rename_source(self, old, new):
+        """Move every id of source old to new (one-time, e.g. after a config change).
+        Ids old had already evicted stay reachable through in_history(new, ...)."""
+        name = f"rename:{old}:{new}"
+        with self.lock:
+            if self.conn.execute("SELECT 1 FROM migrations WHERE name = ?", (name,)).fetchone():
+                return 0
+            ids = [r[0] for r in self.conn.execute("SELECT id FROM seen WHERE source = ?", (old,))]
+            self._mark_unsynced()
+            self.conn.execute("BEGIN")
+            try:
+                self.conn.execute("UPDATE OR IGNORE seen SET source = ? WHERE source = ?", (new, old))
+                self.conn.execute("DELETE FROM seen WHERE source = ?", (old,))
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO meta (name, value) VALUES (?, ?)", (f"renamed:{new}", old)
+                )
+                self.conn.execute("INSERT INTO migrations (name, ts) VALUES (?, ?)", (name, time.time()))
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+            self.renamed[new] = old
+            for item_id in ids:
+                self.history.add(_history_key(new, item_id))
+        if ids:
+            logger.info("Moved %d seen ids from %s to %s", len(ids), old, new)
+        return len(ids)
+
+    def clear(self, source):
+        """Forget source. Its ids stay in the Bloom filter but no longer count as seen."""
+        with self.lock:
+            self.conn.execute("DELETE FROM seen WHERE source = ?", (source,))
+            self.conn.execute("DELETE FROM meta WHERE name IN (?, ?)", (f"pruned:{source}", f"renamed:{source}"))
+            self.pruned.discard(source)
+            self.renamed.pop(source, None)
+
+    def seen_set(self, source, pack=None):
+        return SeenSet(self, source, pack)
+
+    def migrate_json(self, source, path, key="id"):
+        """Import a legacy JSON state file into seen once, then delete it.
+        The file holds a list of ids, or of records whose `key` is the id (key=None
+        for plain ids); records are kept as data. List order is kept in ts."""
+        name = f"{source}:{os.path.basename(path)}"
+        with self.lock:
+            done = self.conn.execute("SELECT 1 FROM migrations WHERE name = ?", (name,)).fetchone()
+        if done or not os.path.exists(path):
+            return 0
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                items = json.load(f)
+        except Exception:
+            logger.exception("Failed to read %s for migration; leaving it in place", path)
+            return 0
+        now = time.time()
+        rows = []
+        for i, item in enumerate(items or []):
+            if key is None:
+                item_id, data = item, None
+            elif isinstance(item, dict) and item.get(key) is not None:
+                item_id, data = item[key], json.dumps(item, ensure_ascii=False)
+            else:
+                continue
+            # earlier entries get older timestamps
+            rows.append((source, str(item_id), now - (len(items) - i) * 1e-3, data))
+        with self.lock:
+            self._mark_unsynced()
+            self.conn.execute("BEGIN")
+            try:
+                self.conn.executemany(
+                    "INSERT OR IGNORE INTO seen (source, id, ts, data) VALUES (?, ?, ?, ?)", rows
+                )
+                self.conn.execute("INSERT INTO migrations (name, ts) VALUES (?, ?)", (name, now))
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+            for row in rows:
+                self.history.add(_history_key(row[0], row[1]))
+        try:
+            os.remove(path)
+        except Exception:
+            logger.exception("Migrated %s but failed to remove it", path)
+        logger.info("Migrated %d %s entries from %s", len(rows), source, path)
+        return len(rows)
+
+    def close(self):
+        with self.lock:
+            if self.conn is None:
+                return
+            try:
+                self._save_history()
+            except Exception:
+                logger.exception("Failed to save the seen-history filter of %s", self.path)
+            try:
+                # fold the WAL back into the database file so it can be committed on its own;
+                # a run that wrote nothing leaves the file as it was
+                if self.conn.total_changes:
+                    self.conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            except Exception:
+                logger.exception("WAL checkpoint of %s failed", self.path)
+            self.conn.close()
+            self.conn = None
+
+
+class SeenSet:
+    """Set-like view of one source. The ids are loaded in one query and checked in
+    memory; add() writes through to the store. With pack (e.g. pack_base36) ids are
+    kept and stored in their compact integer form."""
+
+    def __init__(self, store, source, pack=None):
+        self.store = store
+        self.source = source
+        self.pack = pack or (lambda item_id: item_id)
+        if pack:
+            store.repack(source, pack)
+        self.ids = store.ids(source)
+
+    def __contains__(self, item_id):
+        key = self.pack(item_id)
+        return key in self.ids or self.store.in_history(self.source, key)
+
+    def add(self, item_id):
+        key = self.pack(item_id)
+        self.store.add(self.source, key)
+        self.ids.add(key)
+
+    def touch(self, item_ids):
+        """Mark seen ids that showed up again as recently used."""
+        keys = [k for k in map(self.pack, item_ids) if k in self.ids]
+        if keys:
+            self.store.touch(self.source, keys)
+
+    def prune(self, max_entries=None, max_age=None):
+        removed = self.store.prune(self.source, max_entries, max_age)
+        if removed:
+            self.ids = self.store.ids(self.source)
+        return removed
+
+    def __len__(self):
+        return len(self.ids)
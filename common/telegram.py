@@ -0,0 +1,206 @@
+"""Pooled Telegram Bot API client shared by the bots.
+
+All sendPhoto/sendVideo/sendMediaGroup/sendMessage calls go through one
+keep-alive connection pool per bot token, so a run with hundreds of sends
+reuses a handful of TLS connections to api.telegram.org. When httpx with
+HTTP/2 support (``pip install httpx[http2]``) is installed the pool speaks
+HTTP/2, otherwise a requests Session is used. Calls are paced and retried by
+common.ratelimit. MultipartStream/call_stream upload a file straight from an
+iterator of chunks (e.g. a download in progress) without a temp file.
+"""
+import logging
+import os
+import threading
+import uuid
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from common.ratelimit import send_with_retry
+
+try:
+    import httpx
+    import h2  # noqa: F401 - httpx needs it for http2=True
+except Exception:
+    httpx = None
+
+logger = logging.getLogger(__name__)
+# httpx logs every request URL at INFO, and Bot API URLs embed the bot token
+logging.getLogger("httpx").setLevel(logging.WARNING)
+
+API_BASE = "https://api.telegram.org"
+CONNECT_TIMEOUT = float(os.getenv("TELEGRAM_CONNECT_TIMEOUT", "10"))
+READ_TIMEOUT = float(os.getenv("TELEGRAM_READ_TIMEOUT", "60"))
+POOL_SIZE = int(os.getenv("TELEGRAM_POOL_SIZE", "8"))
+# connection-level retries only, for requests that never reached Telegram; see
+# TelegramClient.call for which responses are retried
+CONNECT_RETRIES = int(os.getenv("TELEGRAM_CONNECT_RETRIES", "3"))
+USE_HTTP2 = os.getenv("TELEGRAM_HTTP2", "true").lower() in ("1", "true", "yes")
+
+
+def _requests_session():
+    sess = requests.Session()
+    retry = Retry(total=CONNECT_RETRIES, connect=CONNECT_RETRIES, read=0, status=0, backoff_factor=0.5)
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=POOL_SIZE, max_retries=retry)
+    sess.mount("https://", adapter)
+    return sess
+
+
+def _httpx_client():
+    # httpx ignores the client's limits when given a transport, so they go on the transport
+    transport = httpx.HTTPTransport(
+        http2=True,
+        retries=CONNECT_RETRIES,
+        limits=httpx.Limits(max_connections=POOL_SIZE, max_keepalive_connections=POOL_SIZE),
+    )
+    return httpx.Client(
+        http2=True,
+        transport=transport,
+        timeout=httpx.Timeout(READ_TIMEOUT, connect=CONNECT_TIMEOUT),
+    )
+
+
+class MultipartStream:
+    """multipart/form-data body that streams one file part from an iterator of chunks.
+
+    Text fields are encoded up front; the file bytes are passed through as they
+    arrive, so a download can be piped into an upload without touching disk.
+    When file_size is known the body length is known too and the request is sent
+    with a Content-Length instead of chunked transfer encoding.
+    """
+
+    def __init__(self, fields, file_field, filename, content_type, chunks, file_size=None):
+        self.boundary = uuid.uuid4().hex
+        self.chunks = chunks
+        self.file_size = file_size
+        parts = []
+        for name, value in fields.items():
+            if value is None:
+                continue
+            if isinstance(value, bool):
+                value = "true" if value else "false"
+            parts.append(
+                f'--{self.boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'
+            )
+        safe_name = filename.replace('"', "")
+        parts.append(
+            f'--{self.boundary}\r\nContent-Disposition: form-data; name="{file_field}"; filename="{safe_name}"\r\n'
+            f"Content-Type: {content_type or 'application/octet-stream'}\r\n\r\n"
+        )
+        self.head = "".join(parts).encode("utf-8")
+        self.tail = f"\r\n--{self.boundary}--\r\n".encode("ascii")
+
+    @property
+    def content_type(self):
+        return f"multipart/form-data; boundary={self.boundary}"
+
+    def length(self):
+        if self.file_size is None:
+            return None
+        return len(self.head) + self.file_size + len(self.tail)
+
+    def __iter__(self):
+        yield self.head
+        sent = 0
+        for chunk in self.chunks:
+            if chunk:
+                sent += len(chunk)
+                yield chunk
+        if self.file_size is not None and sent != self.file_size:
+            # a short/long body would corrupt the request framing
+            raise IOError(f"streamed {sent} bytes but announced {self.file_size}")
+        yield self.tail
+
+
+class _SizedBody:
+    """Iterable with a __len__ so requests sends a Content-Length rather than chunks."""
+
+    def __init__(self, body, length):
+        self.body = body
+        self.size = length
+
+    def __iter__(self):
+        return iter(self.body)
+
+    def __len__(self):
+        return self.size
+
+
+class TelegramClient:
+    """Thin wrapper around a pooled HTTP client for one bot token."""
+
+    def __init__(self, token):
+        self.token = token
+        self.http2 = bool(httpx) and USE_HTTP2
+        self.http = _httpx_client() if self.http2 else _requests_session()
+
+    def _post(self, url, data, json, files, timeout):
+        # rewind uploads so a retried request sends the whole file again
+        for f in (files or {}).values():
+            fh = f[1] if isinstance(f, tuple) else f
+            if hasattr(fh, "seek"):
+                fh.seek(0)
+        if self.http2:
+            return self.http.post(url, data=data, json=json, files=files,
+                                  timeout=httpx.Timeout(timeout, connect=CONNECT_TIMEOUT))
+        return self.http.post(url, data=data, json=json, files=files, timeout=(CONNECT_TIMEOUT, timeout))
+
+    def call(self, method, data=None, json=None, files=None, timeout=None, cost=1):
+        """POST a Bot API method (e.g. 'sendPhoto') and return the HTTP response.
+
+        The chat_id in data/json selects the rate-limit bucket; cost is the number
+        of messages the call produces (album size for sendMediaGroup).
+        429s are retried; 5xx responses only for methods that send nothing, since a
+        gateway error may arrive after Telegram already posted the message.
+        Network errors propagate to the caller.
+        """
+        url = f"{API_BASE}/bot{self.token}/{method}"
+        chat_id = (data or json or {}).get("chat_id")
+        return send_with_retry(
+            lambda: self._post(url, data, json, files, timeout or READ_TIMEOUT),
+            chat_id,
+            cost=cost,
+            retry_server_errors=not method.startswith(("send", "forward", "copy")),
+        )
+
+    def call_stream(self, method, body, chat_id=None, timeout=None):
+        """POST a MultipartStream body once and return the response.
+
+        A streamed body cannot be replayed, so there is no retry here: the call
+        waits for the rate limiter, and the caller handles 429/errors, usually by
+        falling back to a regular upload.
+        """
+        url = f"{API_BASE}/bot{self.token}/{method}"
+        headers = {"Content-Type": body.content_type}
+        length = body.length()
+        if length is not None:
+            headers["Content-Length"] = str(length)
+        timeout = timeout or READ_TIMEOUT
+
+        def do_request():
+            if self.http2:
+                return self.http.post(url, content=iter(body), headers=headers,
+                                      timeout=httpx.Timeout(timeout, connect=CONNECT_TIMEOUT))
+            data = _SizedBody(body, length) if length is not None else iter(body)
+            return self.http.post(url, data=data, headers=headers, timeout=(CONNECT_TIMEOUT, timeout))
+
+        return send_with_retry(do_request, chat_id, max_attempts=1)
+
+    def close(self):
+        self.http.close()
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(token):
+    """Return the process-wide TelegramClient for token, creating it on first use."""
+    with _clients_lock:
+        client = _clients.get(token)
+        if client is None:
+            client = TelegramClient(token)
+            _clients[token] = client
+            logger.debug("Created Telegram client (http2=%s)", client.http2)
+    return client
@@ -0,0 +1,179 @@
+"""Reusable yt-dlp extractor with an info cache and size-aware format selection.
+
+YoutubeDL instances are built once and reused from a small pool rather than
+per URL (or per short-lived worker thread), and the cookie file is written once. Every URL is first resolved with
+extract_info(download=False); the result is cached, so a URL that is retried
+(or appears in several posts) is not extracted twice. The format selector only
+accepts streams that fit the upload limit, preferring mp4, so nothing is
+downloaded that would be rejected afterwards.
+"""
+import copy
+import logging
+import mimetypes
+import os
+import queue
+import shutil
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import yt_dlp
+except Exception:
+    yt_dlp = None
+
+logger = logging.getLogger(__name__)
+
+# extracted formats carry signed URLs that expire after a few hours
+INFO_TTL = 1800
+# at most this many YoutubeDL instances exist; further callers wait for a free one
+POOL_SIZE = 4
+FFMPEG = shutil.which("ffmpeg")
+
+
+def format_selector(max_bytes):
+    """Best single-file format under max_bytes, mp4 first; formats of unknown size come last.
+    With ffmpeg, separate video+audio streams are merged when no single file fits."""
+    known = f"[filesize<{max_bytes}]", f"[filesize_approx<{max_bytes}]"
+    unknown = f"[filesize<?{max_bytes}][filesize_approx<?{max_bytes}]"
+    choices = [f"b[ext=mp4]{k}" for k in known] + [f"b{k}" for k in known]
+    choices += [f"b[ext=mp4]{unknown}", f"b{unknown}"]
+    if FFMPEG:
+        choices.append(f"bv*[ext=mp4]{unknown}+ba[ext=m4a]/bv*{unknown}+ba")
+    return "/".join(choices)
+
+
+class YtdlpClient:
+    def __init__(self, max_bytes, cookies_path=None, cookies_content=None, info_ttl=INFO_TTL, pool_size=POOL_SIZE):
+        self.max_bytes = max_bytes
+        self.info_ttl = info_ttl
+        self.pool_size = max(1, pool_size)
+        self.lock = threading.Lock()
+        # idle instances; self.created counts those built so far, checked out or not
+        self.pool = queue.LifoQueue()
+        self.created = 0
+        # url -> (expires, info or None)
+        self.infos = {}
+        self.temp_cookie_file = None
+        if cookies_content and not cookies_path:
+            try:
+                fd, self.temp_cookie_file = tempfile.mkstemp(prefix="ytdlp_cookies_", suffix=".txt")
+                with os.fdopen(fd, "w", encoding="utf-8") as cf:
+                    cf.write(cookies_content)
+                cookies_path = self.temp_cookie_file
+            except Exception:
+                logger.exception("Failed to write yt-dlp cookie content to temp file")
+                cookies_path = None
+        self.opts = {
+            "outtmpl": "%(id)s.%(ext)s",
+            "noplaylist": True,
+            "quiet": True,
+            "no_warnings": True,
+            "noprogress": True,
+            "ignoreerrors": True,
+            "format": format_selector(max_bytes),
+            "merge_output_format": "mp4",
+            # guard for formats whose size was unknown when selected
+            "max_filesize": max_bytes,
+        }
+        if cookies_path:
+            self.opts["cookiefile"] = cookies_path
+
+    @contextmanager
+    def _ydl(self):
+        """Check a YoutubeDL out of the pool for the duration of the block (instances are
+        not safe to use from two threads at once); a new one is built while fewer than
+        pool_size exist."""
+        try:
+            ydl = self.pool.get_nowait()
+        except queue.Empty:
+            with self.lock:
+                build = self.created < self.pool_size
+                if build:
+                    self.created += 1
+            if build:
+                try:
+                    ydl = yt_dlp.YoutubeDL(dict(self.opts))
+                except Exception:
+                    with self.lock:
+                        self.created -= 1
+                    raise
+            else:
+                ydl = self.pool.get()
+        try:
+            yield ydl
+        finally:
+            self.pool.put(ydl)
+
+    def extract(self, url):
+        """Info dict of url with a format under the size limit selected, or None; cached."""
+        now = time.time()
+        with self.lock:
+            cached = self.infos.get(url)
+            if cached and cached[0] > now:
+                return cached[1]
+        try:
+            with self._ydl() as ydl:
+                info = ydl.extract_info(url, download=False)
+        except Exception:
+            logger.exception("yt-dlp failed to extract %s", url)
+            info = None
+        if info is not None and not isinstance(info, dict):
+            info = None
+        if info is not None and info.get("_type") == "playlist":
+            entries = [e for e in info.get("entries") or [] if e]
+            info = entries[0] if entries else None
+        with self.lock:
+            self.infos[url] = (now + self.info_ttl, info)
+        return info
+
+    def download(self, url):
+        """Download url's selected format into a temp dir. Returns (path, content_type, size)
+        or (None, None, 0); nothing is fetched when no format fits the limit."""
+        info = self.extract(url)
+        if not info:
+            logger.info("yt-dlp found no format of %s under %d bytes", url, self.max_bytes)
+            return None, None, 0
+        formats = info.get("requested_formats") or [info]
+        expected = sum(f.get("filesize") or f.get("filesize_approx") or 0 for f in formats)
+        if expected > self.max_bytes:
+            return None, None, expected
+        tmp_dir = tempfile.mkdtemp(prefix="ytdlp_media_")
+        try:
+            with self._ydl() as ydl:
+                ydl.params["paths"] = {"home": tmp_dir}
+                result = ydl.process_ie_result(copy.deepcopy(info), download=True)
+                downloads = (result or {}).get("requested_downloads") or []
+                fn = downloads[0].get("filepath") if downloads else None
+                if not fn and result:
+                    fn = ydl.prepare_filename(result)
+            if fn and os.path.exists(fn):
+                size = os.path.getsize(fn)
+                if size > self.max_bytes:
+                    shutil.rmtree(tmp_dir, ignore_errors=True)
+                    return None, None, size
+                ctype, _ = mimetypes.guess_type(fn)
+                return fn, ctype, size
+        except Exception:
+            logger.exception("yt-dlp failed to download %s", url)
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        return None, None, 0
+
+    def close(self):
+        while True:
+            try:
+                ydl = self.pool.get_nowait()
+            except queue.Empty:
+                break
+            with self.lock:
+                self.created -= 1
+            try:
+                ydl.close()
+            except Exception:
+                pass
+        if self.temp_cookie_file and os.path.exists(self.temp_cookie_file):
+            try:
+                os.remove(self.temp_cookie_file)
+            except Exception:
+                pass
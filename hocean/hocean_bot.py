@@ -1,57 +1,108 @@
-import os, json, html, time, random, cloudscraper
-from bs4 import BeautifulSoup
+import os, sys, html, time, random, logging, cloudscraper
+from concurrent.futures import ThreadPoolExecutor
+from bs4 import SoupStrainer
 from dotenv import load_dotenv
 
 load_dotenv()
+# retries, browser escalations and the fetch tier are reported by common's loggers
+logging.basicConfig(level=getattr(logging, os.getenv("LOG_LEVEL", "INFO").upper(), logging.INFO),
+                    format="[%(name)s] %(message)s")
 
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+from common.telegram import get_client
+from common.parsing import make_soup, has_class
+from common.fetch import HostLimiter, get_with_retry
+from common.listing_cache import ListingCache
+from common.state import StateStore
+
 DATA_DIR = os.path.join(BASE_DIR, "hocean", "data")
+# legacy seen-links file, imported into the state database on the first run
 OLD_PATH = os.path.join(DATA_DIR, "hocean_old.json")
+SEEN_DB_PATH = os.path.join(DATA_DIR, "state.db")
+SOURCE = "hocean"
+LISTING_CACHE_PATH = os.path.join(DATA_DIR, "listing_cache.json")
 
 URL = "https://hentaiocean.com/view/recent-releases"
 HEADERS = {"User-Agent": "Mozilla/5.0"}
 
 MAX_CAPTION_LENGTH = 1024
 
+# Detail pages are fetched by a pool of HOCEAN_CONCURRENCY threads; at most
+# HOCEAN_PER_HOST_LIMIT requests hit one host at a time, and each request starts
+# after a random delay in HOCEAN_JITTER_MIN..HOCEAN_JITTER_MAX seconds.
+DETAIL_CONCURRENCY = int(os.getenv("HOCEAN_CONCURRENCY", "4"))
+PER_HOST_LIMIT = int(os.getenv("HOCEAN_PER_HOST_LIMIT", "3"))
+DETAIL_JITTER = (
+    float(os.getenv("HOCEAN_JITTER_MIN", "0.2")),
+    float(os.getenv("HOCEAN_JITTER_MAX", "1.0")),
+)
+
 scraper = cloudscraper.create_scraper()
+host_semaphore = HostLimiter(PER_HOST_LIMIT)
+listing_cache = ListingCache(LISTING_CACHE_PATH)
+
+# both the listing grid and the detail columns live in section.section; skip the rest of the page
+CONTENT_ONLY = SoupStrainer("section", class_=has_class("section"))
 
 # -------------------- Fetch links --------------------
 def fetch_recent_links():
-    response = scraper.get(URL, headers=HEADERS, timeout=10)
-    soup = BeautifulSoup(response.text, "html.parser")
-
-    section = soup.select_one("section.section div.container div.fixed-grid div.grid")
-    if not section:
+    """Return the links on the listing, or None when it is unchanged since the last run."""
+    headers = {**HEADERS, **listing_cache.conditional_headers(URL)}
+    response = get_with_retry(scraper, URL, headers=headers, timeout=10)
+    if response.status_code == 304:
+        print("Listing not modified since the last run.")
+        return None
+    listing_cache.update_validators(URL, response)
+    grid = find_listing_grid(response.text)
+    if grid is None:
         return []
+    if listing_cache.unchanged(URL, str(grid)):
+        print("Listing content unchanged since the last run.")
+        return None
+    return links_from_grid(grid)
 
-    links = [a['href'] for a in section.find_all("a", href=True)]
-    return list(set(links))
+
+def find_listing_grid(page_html):
+    soup = make_soup(page_html, CONTENT_ONLY)
+    return soup.select_one("section.section div.container div.fixed-grid div.grid")
 
 
-def load_old_links():
-    if not os.path.exists(OLD_PATH):
-        return set()
-    with open(OLD_PATH, "r", encoding="utf-8") as f:
-        return set(json.load(f))
+def links_from_grid(grid):
+    links = [a['href'] for a in grid.find_all("a", href=True)]
+    return list(set(links))
 
 
-def save_links(links):
-    with open(OLD_PATH, "w", encoding="utf-8") as f:
-        json.dump(list(links), f, ensure_ascii=False, indent=2)
+def parse_recent_links(page_html):
+    grid = find_listing_grid(page_html)
+    return links_from_grid(grid) if grid is not None else []
 
 
-def get_fresh_links():
+def get_fresh_links(store):
     current_links = fetch_recent_links()
-    old_links = load_old_links()
-    fresh_links = [link for link in current_links if link not in old_links]
-    save_links(current_links)
-    return fresh_links
+    if current_links is None:
+        return []
+    return [link for link in current_links if not store.contains(SOURCE, link)]
 
 # -------------------- Parse detail page --------------------
 def parse_detail_page(url):
     try:
-        response = scraper.get(url, headers=HEADERS, timeout=10)
-        soup = BeautifulSoup(response.text, "html.parser")
+        with host_semaphore(url):
+            # polite jitter so the pool does not fire all requests at once
+            time.sleep(random.uniform(*DETAIL_JITTER))
+            response = get_with_retry(scraper, url, headers=HEADERS, timeout=10)
+        if response.status_code != 200:
+            print(f"Failed to fetch {url}: HTTP {response.status_code}")
+            return None
+        return parse_detail_html(url, response.text)
+    except Exception as e:
+        print(f"Failed to parse {url}: {e}")
+        return None
+
+
+def parse_detail_html(url, page_html):
+    try:
+        soup = make_soup(page_html, CONTENT_ONLY)
 
         # Title
         title_tag = soup.select_one("section.section div.container h1.title")
@@ -102,9 +153,13 @@ def parse_detail_page(url):
 BOT_TOKEN = os.getenv("BOT_TOKEN")
 CHAT_ID = os.getenv("CHAT_ID")
 
-def send_telegram_messages(new_h, bot_token, chat_id):
+def send_telegram_messages(new_h, bot_token, chat_id, store):
     for h in reversed(new_h):
-        if not h or not h.get("thumbnail"):
+        if not h:
+            continue
+        if not h.get("thumbnail"):
+            # nothing to send as a photo, and retrying will not change that
+            store.add(SOURCE, h["url"])
             continue
 
         # Build initial static caption
@@ -138,8 +193,8 @@ def send_telegram_messages(new_h, bot_token, chat_id):
         )
 
         try:
-            resp = scraper.post(
-                f"https://api.telegram.org/bot{bot_token}/sendPhoto",
+            resp = get_client(bot_token).call(
+                "sendPhoto",
                 data={
                     "chat_id": chat_id,
                     "photo": h["thumbnail"],
@@ -150,28 +205,35 @@ def send_telegram_messages(new_h, bot_token, chat_id):
             )
             if resp.status_code != 200:
                 print(f"Telegram send failed for {title}: {resp.text}")
+            else:
+                store.add(SOURCE, h["url"])
         except Exception as e:
             print(f"Error sending Telegram message for {title}: {e}")
 
-        # Random delay to prevent hitting rate limits
-        time.sleep(random.uniform(1, 2))
-
 
 # -------------------- Main --------------------
 def main():
-    fresh_links = get_fresh_links()
+    store = StateStore(SEEN_DB_PATH)
+    try:
+        store.migrate_json(SOURCE, OLD_PATH, key=None)
+        run(store)
+    finally:
+        store.close()
+
+
+def run(store):
+    fresh_links = get_fresh_links(store)
     if not fresh_links:
         print("No new releases found.")
+        listing_cache.finish(URL)
         return
 
-    new_h = []
-    for url in fresh_links:
-        parsed = parse_detail_page(url)
-        if parsed:
-            new_h.append(parsed)
-        time.sleep(random.uniform(0.5, 1.5))  # delay between detail page requests
+    # a backlog after a missed run is fetched in parallel; results keep the link order
+    with ThreadPoolExecutor(max_workers=max(1, DETAIL_CONCURRENCY)) as pool:
+        new_h = [parsed for parsed in pool.map(parse_detail_page, fresh_links) if parsed]
 
-    send_telegram_messages(new_h, BOT_TOKEN, CHAT_ID)
+    send_telegram_messages(new_h, BOT_TOKEN, CHAT_ID, store)
+    listing_cache.finish(URL, all(store.contains(SOURCE, link) for link in fresh_links))
 
 
 if __name__ == "__main__":
@@ -1,14 +1,38 @@
 from dotenv import load_dotenv
-import os, json, time, random
-from bs4 import BeautifulSoup
-import requests
-from playwright.sync_api import sync_playwright
+import os, sys, time, random, logging, asyncio, queue, threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import urljoin
+from bs4 import SoupStrainer
+from playwright.async_api import async_playwright
 
 load_dotenv()
+# retries, browser escalations and the fetch tier are reported by common's loggers
+logging.basicConfig(level=getattr(logging, os.getenv("LOG_LEVEL", "INFO").upper(), logging.INFO),
+                    format="[%(name)s] %(message)s")
 
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+from common.telegram import get_client
+from common.fetch import NOT_MODIFIED, TieredFetcher, record_tier
+from common.listing_cache import ListingCache
+from common.state import StateStore
+from common.parsing import make_soup, has_class
+from common.browser import (
+    install_resource_filter_async,
+    load_storage_state,
+    save_storage_state_async,
+    wait_until_ready_async,
+)
+
 DATA_DIR = os.path.join(BASE_DIR, "nhentai", "data")
+# legacy seen-galleries file, imported into the state database on the first run
 OLD_PATH = os.path.join(DATA_DIR, "old.json")
+SEEN_DB_PATH = os.path.join(DATA_DIR, "state.db")
+SOURCE = "nhentai"
+# cookies/localStorage (Cloudflare clearance) reused between runs
+STATE_PATH = os.path.join(DATA_DIR, "browser_state.json")
+TIER_PATH = os.path.join(DATA_DIR, "fetch_tiers.json")
+LISTING_CACHE_PATH = os.path.join(DATA_DIR, "listing_cache.json")
 
 BOT_TOKEN = os.getenv("BOT_TOKEN")
 CHAT_ID = os.getenv("CHAT_ID")
@@ -21,6 +45,28 @@ DEFAULT_UA = (
     " Chrome/120.0.0.0 Safari/537.36"
 )
 
+HOME_URL = "https://nhentai.net/"
+FIRST_PARTY = ("nhentai.net",)
+HOMEPAGE_READY_SELECTOR = "div.index-popular .gallery"
+GALLERY_READY_SELECTOR = "div#cover, section#tags"
+
+# partial parsing: only the containers the bot reads are built into a tree
+POPULAR_ONLY = SoupStrainer("div", class_=has_class("index-popular"))
+GALLERY_ONLY = SoupStrainer(id=["cover", "tags"])
+OG_IMAGE_ONLY = SoupStrainer("meta", property="og:image")
+
+# Gallery pages are fetched by a pool of pages in one browser context (so Cloudflare
+# cookies are shared); NHENTAI_CONCURRENCY bounds the pool, and each navigation starts
+# after a random delay in NHENTAI_JITTER_MIN..NHENTAI_JITTER_MAX seconds.
+GALLERY_CONCURRENCY = int(os.getenv("NHENTAI_CONCURRENCY", "4"))
+GALLERY_JITTER = (
+    float(os.getenv("NHENTAI_JITTER_MIN", "0.2")),
+    float(os.getenv("NHENTAI_JITTER_MAX", "1.0")),
+)
+
+
+listing_cache = ListingCache(LISTING_CACHE_PATH)
+
 
 def ensure_data_dir():
     try:
@@ -29,81 +75,43 @@ def ensure_data_dir():
         pass
 
 
-def load_json_path(path):
-    ensure_data_dir()
-    if not os.path.exists(path):
-        return []
+def save_debug_html(name, content):
+    """Write page HTML to DATA_DIR for troubleshooting. Returns the path or None."""
+    debug_path = os.path.join(DATA_DIR, name)
     try:
-        with open(path, "r", encoding="utf-8") as f:
-            return json.load(f)
-    except json.JSONDecodeError:
-        ts = int(time.time())
-        corrupt = f"{path}.corrupt.{ts}"
-        try:
-            os.replace(path, corrupt)
-        except Exception:
-            pass
-        return []
+        ensure_data_dir()
+        with open(debug_path, "w", encoding="utf-8") as fh:
+            fh.write(content or "")
+        return debug_path
     except Exception:
-        return []
+        return None
 
 
-def save_json_path(path, data):
-    ensure_data_dir()
-    tmp = f"{path}.tmp"
-    with open(tmp, "w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
-    try:
-        os.replace(tmp, path)
-    except Exception:
-        try:
-            os.remove(path)
-        except Exception:
-            pass
-        os.replace(tmp, path)
-
 # ----------------------------
-# Use a single Playwright browser/context for homepage + gallery pages
-# This ensures Cloudflare cookies/challenges are shared between navigations
+# Homepage listing
 # ----------------------------
-home_url = "https://nhentai.net/"
-results = []
+def parse_listing(hp_html):
+    """Parse the popular galleries on the homepage into [(gid, title, homepage_thumbnail)]."""
+    return listing_from_container(find_popular_container(hp_html))
 
-with sync_playwright() as p:
-    browser = p.chromium.launch(headless=True)
-    context = browser.new_context(user_agent=DEFAULT_UA)
-    page = context.new_page()
 
-    # fetch homepage
-    try:
-        page.goto(home_url, timeout=60000)
-        time.sleep(2)
-        hp_html = page.content()
-    except Exception:
-        try:
-            page.goto(home_url, timeout=90000)
-            time.sleep(3)
-            hp_html = page.content()
-        except Exception:
-            hp_html = None
+def changed_listing(hp_html):
+    """Like parse_listing, but None when the popular container is the same as last run."""
+    parent_div = find_popular_container(hp_html)
+    if listing_cache.unchanged(HOME_URL, str(parent_div)):
+        print("[nhentai_bot] Popular galleries unchanged since the last run")
+        return None
+    return listing_from_container(parent_div)
 
-    if not hp_html:
-        raise Exception("Failed to fetch homepage via Playwright")
 
-    soup = BeautifulSoup(hp_html, "html.parser")
+def find_popular_container(hp_html):
+    soup = make_soup(hp_html, POPULAR_ONLY)
     parent_div = soup.find("div", class_="container index-container index-popular")
     if not parent_div:
         parent_div = soup.find("div", class_="index-popular")
     if not parent_div:
         ts = int(time.time())
-        debug_name = f"homepage_debug_{ts}.html"
-        debug_path = os.path.join(DATA_DIR, debug_name)
-        try:
-            ensure_data_dir()
-            with open(debug_path, "w", encoding="utf-8") as fh:
-                fh.write(hp_html or "")
-        except Exception:
-            debug_path = None
+        debug_path = save_debug_html(f"homepage_debug_{ts}.html", hp_html)
         snippet = (hp_html or "")[:2000]
         if debug_path:
             print(f"[nhentai_bot] Couldn't find popular container; saved homepage HTML to {debug_path}")
@@ -112,21 +120,14 @@ with sync_playwright() as p:
         print("[nhentai_bot] Snippet of received homepage (first 2000 chars):")
         print(snippet)
         raise Exception(f"Couldn't find the popular container on homepage; saved debug HTML to {debug_path}")
+    return parent_div
+
 
+def listing_from_container(parent_div):
     galleries = parent_div.find_all("div", class_="gallery")
     print(f"[nhentai_bot] Found {len(galleries)} gallery elements on homepage")
-    for g in galleries[:10]:
-        a = g.find("a", href=True)
-        if not a:
-            continue
-        href = a["href"]
-        parts = [p for p in href.split('/') if p]
-        gid = parts[-1] if parts else None
-        title = (a.find("div", class_="caption") or a.find("span", class_="caption") or a).text.strip()
-        print(f"  - {gid}: {title}")
 
-    # collect gallery pages using same context (preserves cookies/challenge tokens)
-    from urllib.parse import urljoin as _urljoin
+    listing = []
     for gallery in galleries:
         a_tag = gallery.find("a", href=True)
         if not a_tag:
@@ -137,7 +138,8 @@ with sync_playwright() as p:
         if not gid:
             continue
         title = (a_tag.find("div", class_="caption") or a_tag.find("span", class_="caption") or a_tag).text.strip()
-        gallery_url = f"https://nhentai.net/g/{gid}/"
+        if len(listing) < 10:
+            print(f"  - {gid}: {title}")
 
         # try to extract thumbnail directly from the homepage listing (avoids visiting gallery page)
         homepage_thumbnail = None
@@ -146,7 +148,7 @@ with sync_playwright() as p:
             for attr in ("src", "data-src"):
                 v = img_tag.get(attr)
                 if v:
-                    homepage_thumbnail = _urljoin("https://nhentai.net", v)
+                    homepage_thumbnail = urljoin("https://nhentai.net", v)
                     break
             if not homepage_thumbnail:
                 ss = img_tag.get("srcset") or img_tag.get("data-srcset")
@@ -156,53 +158,250 @@ with sync_playwright() as p:
                     if parts_ss:
                         last = parts_ss[-1]
                         url_part = last.split()[0]
-                        homepage_thumbnail = _urljoin("https://nhentai.net", url_part)
+                        homepage_thumbnail = urljoin("https://nhentai.net", url_part)
+
+        listing.append((gid, title, homepage_thumbnail))
+    return listing
 
-        # navigate to gallery using the same page/context
+
+# ----------------------------
+# Use a single Playwright browser/context for homepage + gallery pages
+# This ensures Cloudflare cookies/challenges are shared between navigations
+# ----------------------------
+async def fetch_homepage(page):
+    try:
+        await page.goto(HOME_URL, timeout=60000)
+        await wait_until_ready_async(page, HOMEPAGE_READY_SELECTOR)
+        return await page.content()
+    except Exception:
         try:
-            page.goto(gallery_url, timeout=60000)
-            # wait for cover or tags; give CF a chance to complete
-            try:
-                page.wait_for_selector("div#cover, section#tags", timeout=8000)
-            except Exception:
-                pass
-            time.sleep(random.uniform(1, 2))
-            page_html = page.content()
+            await page.goto(HOME_URL, timeout=90000)
+            await wait_until_ready_async(page, HOMEPAGE_READY_SELECTOR, timeout=30000)
+            return await page.content()
         except Exception:
-            try:
-                page.goto(gallery_url, timeout=90000)
-                time.sleep(2)
-                page_html = page.content()
-            except Exception:
-                page_html = None
+            return None
+
+
+async def fetch_gallery_html(page, gid):
+    """Navigate page to gallery gid and return its rendered HTML (None on failure)."""
+    gallery_url = f"https://nhentai.net/g/{gid}/"
+    try:
+        await page.goto(gallery_url, timeout=60000)
+        # wait for cover or tags; give CF a chance to complete
+        await wait_until_ready_async(page, GALLERY_READY_SELECTOR, timeout=8000)
+        return await page.content()
+    except Exception:
+        try:
+            await page.goto(gallery_url, timeout=90000)
+            await wait_until_ready_async(page, GALLERY_READY_SELECTOR)
+            return await page.content()
+        except Exception:
+            return None
+
+
+async def fetch_galleries(context, listing, on_record):
+    """Fetch gallery pages concurrently with a pool of GALLERY_CONCURRENCY pages and
+    call on_record with each extracted record as soon as its page has been parsed.
+    """
+    pool = asyncio.Queue()
+    for _ in range(max(1, min(GALLERY_CONCURRENCY, len(listing)))):
+        pool.put_nowait(await context.new_page())
+
+    async def worker(gid, title, homepage_thumbnail):
+        page = await pool.get()
+        try:
+            # polite jitter so the pool does not fire all navigations at once
+            await asyncio.sleep(random.uniform(*GALLERY_JITTER))
+            page_html = await fetch_gallery_html(page, gid)
+        finally:
+            pool.put_nowait(page)
 
         if not page_html:
             # could not fetch gallery; save debug and skip
-            ts = int(time.time())
-            debug_name = f"gallery_debug_{gid}_{ts}.html"
-            debug_path = os.path.join(DATA_DIR, debug_name)
+            save_debug_html(f"gallery_debug_{gid}_{int(time.time())}.html", "")
+            return None
+
+        # extract right away so only the record outlives this page, not its HTML/soup
+        on_record(build_record(gid, title, page_html, homepage_thumbnail))
+
+    await asyncio.gather(*(worker(*entry) for entry in listing))
+
+
+async def scrape_with_browser(on_record, known_ids=(), pending=None, on_listing=None):
+    """Browser tier: fetch the homepage listing and the gallery pages of galleries not in
+    known_ids, passing each gallery record to on_record as it is extracted. When pending
+    is given (galleries the HTTP tier could not fetch) only those are visited; the
+    homepage is still loaded to pass the Cloudflare check.
+    """
+    async with async_playwright() as p:
+        browser = await p.chromium.launch(headless=True)
+        try:
+            state = load_storage_state(STATE_PATH)
+            # warm start from the saved cookies first; fall back to a cold context if they no longer work
+            attempts = [state, None] if state else [None]
+            for storage_state in attempts:
+                context = await browser.new_context(user_agent=DEFAULT_UA, storage_state=storage_state)
+                resource_filter = await install_resource_filter_async(context, FIRST_PARTY)
+                page = await context.new_page()
+
+                hp_html = await fetch_homepage(page)
+                if hp_html and "index-popular" in hp_html:
+                    break
+                if storage_state is not None:
+                    print("[nhentai_bot] Saved browser state did not pass the homepage; retrying with a cold context")
+                    await context.close()
+            if not hp_html:
+                raise Exception("Failed to fetch homepage via Playwright")
+
+            if pending is None:
+                listing = changed_listing(hp_html)
+                if listing is None:
+                    await save_storage_state_async(context, STATE_PATH)
+                    return
+                if on_listing:
+                    on_listing(listing)
+                # diff against stored state first: only unseen galleries need a detail page
+                unseen = [entry for entry in listing if entry[0] not in known_ids]
+                print(f"[nhentai_bot] {len(unseen)} of {len(listing)} listed galleries are unseen; fetching their pages")
+            else:
+                unseen = pending
+            # collect gallery pages using same context (preserves cookies/challenge tokens)
+            await fetch_galleries(context, unseen, on_record)
+            await save_storage_state_async(context, STATE_PATH)
+            if resource_filter:
+                print(f"[nhentai_bot] Resource filter: {resource_filter.summary()}")
+        finally:
             try:
-                ensure_data_dir()
-                with open(debug_path, "w", encoding="utf-8") as fh:
-                    fh.write("")
+                await browser.close()
             except Exception:
                 pass
-            continue
 
-        # parse gallery page content now (soup will be used later for thumbnail extraction)
-        g_soup = BeautifulSoup(page_html, "html.parser") if page_html else None
-        results.append((gid, title, page_html, g_soup, homepage_thumbnail))
 
-    try:
-        browser.close()
-    except Exception:
-        pass
+# ----------------------------
+# Plain-HTTP tier (no browser process when the saved clearance still works)
+# ----------------------------
+def is_gallery_page(html):
+    return 'id="tags"' in html or 'id="cover"' in html
+
 
+def iter_galleries_http(fetcher, unseen, missing):
+    """Fetch gallery pages over HTTP concurrently, yielding each record as its page
+    arrives. Galleries that could not be fetched are appended to missing (browser tier).
+    """
+    def fetch_one(entry):
+        gid, title, homepage_thumbnail = entry
+        page_html = fetcher.fetch_http(f"https://nhentai.net/g/{gid}/", is_gallery_page)
+        if not page_html:
+            return None
+        return build_record(gid, title, page_html, homepage_thumbnail)
+
+    if not unseen:
+        return
+    with ThreadPoolExecutor(max_workers=max(1, GALLERY_CONCURRENCY)) as pool:
+        futures = {pool.submit(fetch_one, entry): entry for entry in unseen}
+        for future in as_completed(futures):
+            record = future.result()
+            if record:
+                yield record
+            else:
+                missing.append(futures[future])
+
+
+def iter_galleries_browser(known_ids=(), pending=None, on_listing=None):
+    """Run the browser tier on a worker thread and yield records as its pages are parsed,
+    so sending is not held back until the browser closes.
+    """
+    records = queue.Queue()
+    failure = []
+
+    def run():
+        try:
+            asyncio.run(scrape_with_browser(records.put, known_ids, pending, on_listing))
+        except Exception as e:
+            failure.append(e)
+        finally:
+            records.put(None)
+
+    worker = threading.Thread(target=run, daemon=True)
+    worker.start()
+    while True:
+        record = records.get()
+        if record is None:
+            break
+        yield record
+    worker.join()
+    if failure:
+        raise failure[0]
+
+
+def scrape(known_ids=(), on_listing=None):
+    """Tiered scrape: plain HTTP with the saved cookies first, Playwright only for
+    whatever that could not fetch. Yields a record per unseen gallery as soon as its
+    page is parsed; on_listing receives the homepage listing before the first record.
+    Nothing is yielded (and on_listing is not called) when the homepage is unchanged.
+    """
+    fetcher = TieredFetcher(STATE_PATH, user_agent=DEFAULT_UA)
+    hp_html = fetcher.fetch_http(HOME_URL, lambda html: "index-popular" in html, cache=listing_cache)
+    if hp_html is NOT_MODIFIED:
+        record_tier(TIER_PATH, "http")
+        print("[nhentai_bot] Homepage not modified since the last run")
+        return
+    if not hp_html:
+        record_tier(TIER_PATH, "browser")
+        yield from iter_galleries_browser(known_ids, on_listing=on_listing)
+        return
+
+    listing = changed_listing(hp_html)
+    if listing is None:
+        record_tier(TIER_PATH, "http")
+        return
+    if on_listing:
+        on_listing(listing)
+    unseen = [entry for entry in listing if entry[0] not in known_ids]
+    print(f"[nhentai_bot] {len(unseen)} of {len(listing)} listed galleries are unseen; fetching their pages")
+    missing = []
+    yield from iter_galleries_http(fetcher, unseen, missing)
+    if not missing:
+        record_tier(TIER_PATH, "http")
+        return
+
+    print(f"[nhentai_bot] {len(missing)} gallery pages need the browser")
+    record_tier(TIER_PATH, "http+browser")
+    yield from iter_galleries_browser(known_ids, pending=missing)
+
+
+# ----------------------------
 # Build structured results from rendered gallery pages
-from urllib.parse import urljoin
+# ----------------------------
+def pick_from_srcset(srcset):
+    if not srcset:
+        return None
+    candidates = []
+    for part in srcset.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        segments = part.split()
+        url = segments[0]
+        qualifier = segments[1] if len(segments) > 1 else ""
+        weight = 0
+        try:
+            if qualifier.endswith("w"):
+                weight = int(qualifier[:-1])
+            elif qualifier.endswith("x"):
+                weight = int(float(qualifier[:-1]) * 100)
+        except Exception:
+            weight = 0
+        candidates.append((weight, url))
+    if not candidates:
+        return None
+    candidates.sort(reverse=True)
+    return candidates[0][1]
+
+
+def build_record(gid, title, page_html, homepage_thumbnail):
+    g_soup = make_soup(page_html, GALLERY_ONLY)
 
-final_results = []
-for gid, title, page_html, g_soup, homepage_thumbnail in results:
     # extract tags
     tag_section = g_soup.find("section", id="tags")
     tag_containers = tag_section.find_all("div", class_=["tag-container", "field-name"]) if tag_section else []
@@ -230,37 +429,7 @@ for gid, title, page_html, g_soup, homepage_thumbnail in results:
             break
 
     # extract thumbnail (prefer homepage thumbnail collected earlier)
-    thumbnail_url = None
-    if homepage_thumbnail:
-        thumbnail_url = homepage_thumbnail
-    else:
-        thumbnail_url = None
-    def pick_from_srcset(srcset):
-        if not srcset:
-            return None
-        candidates = []
-        for part in srcset.split(","):
-            part = part.strip()
-            if not part:
-                continue
-            segments = part.split()
-            url = segments[0]
-            qualifier = segments[1] if len(segments) > 1 else ""
-            weight = 0
-            try:
-                if qualifier.endswith("w"):
-                    weight = int(qualifier[:-1])
-                elif qualifier.endswith("x"):
-                    weight = int(float(qualifier[:-1]) * 100)
-            except Exception:
-                weight = 0
-            candidates.append((weight, url))
-        if not candidates:
-            return None
-        candidates.sort(reverse=True)
-        return candidates[0][1]
-
-    thumbnail_url = thumbnail_url
+    thumbnail_url = homepage_thumbnail
     cover_div = g_soup.find("div", id="cover") if g_soup else None
     if cover_div:
         img_tag = cover_div.select_one("a > img") or cover_div.find("img")
@@ -280,7 +449,8 @@ for gid, title, page_html, g_soup, homepage_thumbnail in results:
 
     # fallback: open graph image meta
     if not thumbnail_url:
-        meta_og = g_soup.find("meta", property="og:image")
+        # the og:image meta is outside the strained containers; parse the head for it only when needed
+        meta_og = make_soup(page_html, OG_IMAGE_ONLY).find("meta", property="og:image")
         if meta_og and meta_og.get("content"):
             thumbnail_url = meta_og.get("content")
 
@@ -291,43 +461,26 @@ for gid, title, page_html, g_soup, homepage_thumbnail in results:
         except Exception:
             pass
     else:
-        ts = int(time.time())
-        debug_name = f"gallery_debug_{gid}_{ts}.html"
-        debug_path = os.path.join(DATA_DIR, debug_name)
-        try:
-            ensure_data_dir()
-            with open(debug_path, "w", encoding="utf-8") as fh:
-                fh.write(page_html or "")
+        debug_path = save_debug_html(f"gallery_debug_{gid}_{int(time.time())}.html", page_html)
+        if debug_path:
             print(f"[nhentai_bot] Missing thumbnail for {gid}; saved page HTML to {debug_path}")
-        except Exception:
+        else:
             print(f"[nhentai_bot] Missing thumbnail for {gid}; failed to save debug HTML")
 
-    final_results.append({
+    return {
         "id": gid,
         "title": title,
         "tags": tags,
         "pages": page_count,
         "thumbnail_url": thumbnail_url,
-    })
-
-# replace results with structured final_results
-results = final_results
+    }
 
 
 # ----------------------------
-# Step 4: Telegram messages for new galleries
+# Telegram messages for new galleries
 # ----------------------------
-ensure_data_dir()
-past_data = load_json_path(OLD_PATH)
-
-past_ids = {entry["id"] for entry in past_data}
-new_galleries = [g for g in results if g["id"] not in past_ids]
-
-print(f"[nhentai_bot] Parsed {len(results)} galleries; {len(new_galleries)} new galleries to send")
-if len(new_galleries) == 0:
-    print("[nhentai_bot] No new galleries found; exiting without sending messages")
-
-for gallery in reversed(new_galleries):
+def send_gallery(gallery):
+    """Send one gallery to the chat. Returns True when Telegram accepted it."""
     caption = (
         f"🆔 ID: {gallery['id']}\n\n"
         f"📛 Title: {gallery['title']}\n\n"
@@ -338,8 +491,8 @@ for gallery in reversed(new_galleries):
         caption = caption[:MAX_CAPTION_LENGTH - 3] + "..."
 
     try:
-        r = requests.post(
-            f"https://api.telegram.org/bot{BOT_TOKEN}/sendPhoto",
+        r = get_client(BOT_TOKEN).call(
+            "sendPhoto",
             data={
                 "chat_id": CHAT_ID,
                 "photo": gallery["thumbnail_url"],
@@ -349,25 +502,43 @@ for gallery in reversed(new_galleries):
         )
         if r.status_code != 200:
             print(f"[nhentai_bot] Telegram send failed: {r.status_code} {r.text}")
-        else:
-            # mark as sent immediately to avoid duplicates if the process restarts
-            try:
-                past_data.append({
-                    "id": gallery["id"],
-                    "title": gallery["title"],
-                    "tags": gallery.get("tags", []),
-                    "pages": gallery.get("pages"),
-                    "thumbnail_url": gallery.get("thumbnail_url"),
-                })
-                save_json_path(OLD_PATH, past_data)
-            except Exception as e:
-                print(f"[nhentai_bot] Warning: failed to update old.json after sending {gallery['id']}: {e}")
+            return False
+        return True
     except Exception as e:
         print(f"[nhentai_bot] Telegram request exception: {e}")
+        return False
 
 
-# ----------------------------
-# Step 5: Save results
-# ----------------------------
-save_json_path(OLD_PATH, results)
+def main():
+    ensure_data_dir()
+    store = StateStore(SEEN_DB_PATH)
+    try:
+        store.migrate_json(SOURCE, OLD_PATH)
+        run(store)
+    finally:
+        store.close()
+
+
+def run(store):
+    # every record from scrape() is an unseen gallery; send it as soon as it is parsed
+    listing = []
+    sent = 0
+    for record in scrape(known_ids=store.ids(SOURCE), on_listing=listing.extend):
+        if send_gallery(record):
+            # mark as sent immediately to avoid duplicates if the process restarts
+            store.add(SOURCE, record["id"], record)
+            sent += 1
+
+    if not listing:
+        # homepage unchanged since the last run
+        listing_cache.finish(HOME_URL)
+        return
+
+    print(f"[nhentai_bot] {len(listing)} galleries listed; {sent} new galleries sent")
+    if sent == 0:
+        print("[nhentai_bot] No new galleries sent")
+    listing_cache.finish(HOME_URL, all(store.contains(SOURCE, gid) for gid, _, _ in listing))
+
 
+if __name__ == "__main__":
+    main()
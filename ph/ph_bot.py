@@ -1,36 +1,116 @@
 from playwright.sync_api import sync_playwright
 from dotenv import load_dotenv
-from bs4 import BeautifulSoup
-import os, json, requests, html, time
+from bs4 import SoupStrainer
+import os, sys, html, logging
 
 load_dotenv()
+# retries, browser escalations and the fetch tier are reported by common's loggers
+logging.basicConfig(level=getattr(logging, os.getenv("LOG_LEVEL", "INFO").upper(), logging.INFO),
+                    format="[%(name)s] %(message)s")
 
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+from common.telegram import get_client
+from common.browser import install_resource_filter, load_storage_state, save_storage_state, wait_until_ready
+from common.fetch import NOT_MODIFIED, TieredFetcher, record_tier
+from common.listing_cache import ListingCache
+from common.state import StateStore
+from common.parsing import make_soup, has_class
+
 DATA_DIR = os.path.join(BASE_DIR, "ph", "data")
+# legacy seen-videos file, imported into the state database on the first run
 OLD_PATH = os.path.join(DATA_DIR, "ph_old.json")
+SEEN_DB_PATH = os.path.join(DATA_DIR, "state.db")
+SOURCE = "ph"
+# cookies/localStorage (age confirmation, Cloudflare clearance) reused between runs
+STATE_PATH = os.path.join(DATA_DIR, "browser_state.json")
+TIER_PATH = os.path.join(DATA_DIR, "fetch_tiers.json")
+LISTING_CACHE_PATH = os.path.join(DATA_DIR, "listing_cache.json")
+
+# presented by both the browser and the HTTP tier: cf_clearance is bound to the user agent
+DEFAULT_UA = (
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko)"
+    " Chrome/120.0.0.0 Safari/537.36"
+)
 
 url = "https://www.pornhub.com/video?p=homemade&o=mv"
-
-def scrape():
+# domains serving the listing page and its scripts; everything else is third-party
+FIRST_PARTY = ("pornhub.com", "phncdn.com")
+AGE_MODAL_BUTTON = "button.js-closeAgeModal"
+VIDEO_ITEM_SELECTOR = "ul.search-video-thumbs li.pcVideoListItem"
+# only the search results list is parsed; header, sidebars and scripts are skipped
+VIDEO_LIST_ONLY = SoupStrainer("ul", class_=has_class("search-video-thumbs"))
+
+def load_listing(context):
+    """Open the listing in context and return (html, ready) once the video list is present."""
+    resource_filter = install_resource_filter(context, FIRST_PARTY)
+    page = context.new_page()
+    page.goto(url, timeout=60000)
+    # whichever shows up first: the age gate or the video list itself
+    wait_until_ready(page, f"{AGE_MODAL_BUTTON}, {VIDEO_ITEM_SELECTOR}")
+    try:
+        if page.is_visible(AGE_MODAL_BUTTON):
+            page.click(AGE_MODAL_BUTTON)
+        else:
+            print("Age confirmation button not found or already dismissed.")
+    except Exception:
+        print("Age confirmation button not found or already dismissed.")
+    ready = wait_until_ready(page, VIDEO_ITEM_SELECTOR)
+    html_content = page.content()
+    if resource_filter:
+        print(f"Resource filter: {resource_filter.summary()}")
+    return html_content, ready
+
+def has_video_list(html):
+    """Cheap check that a response is the real listing, not a challenge/age-gate page."""
+    return "nf-videos" in html and "pcVideoListItem" in html
+
+def scrape_with_browser():
     with sync_playwright() as p:
         browser = p.chromium.launch(headless=True)
-        context = browser.new_context()
-        page = context.new_page()
-        page.goto(url, timeout=60000)
-        try:
-            page.wait_for_selector("button.js-closeAgeModal", timeout=10000)
-            page.click("button.js-closeAgeModal")
-        except Exception:
-            print("Age confirmation button not found or already dismissed.")
-        time.sleep(3)
-        html_content = page.content()
+        state = load_storage_state(STATE_PATH)
+        # warm start from the saved cookies first; fall back to a cold context if they no longer work
+        attempts = [state, None] if state else [None]
+        html_content = None
+        for storage_state in attempts:
+            context = browser.new_context(user_agent=DEFAULT_UA, storage_state=storage_state)
+            html_content, ready = load_listing(context)
+            if ready:
+                save_storage_state(context, STATE_PATH)
+                break
+            if storage_state is not None:
+                print("Saved browser state did not reach the video list; retrying with a cold context.")
+            else:
+                print("Video list did not appear; parsing whatever loaded.")
+            context.close()
         browser.close()
         return html_content
 
+def scrape(listing_cache=None):
+    """Fetch the listing HTML over plain HTTP when possible, else with Playwright.
+    Returns NOT_MODIFIED when the server answers the conditional request with a 304."""
+    fetcher = TieredFetcher(STATE_PATH, user_agent=DEFAULT_UA)
+    html_content = fetcher.fetch_http(url, has_video_list, cache=listing_cache)
+    # a 304 (NOT_MODIFIED) was served by the HTTP tier too
+    if html_content is NOT_MODIFIED or html_content:
+        record_tier(TIER_PATH, "http")
+        return html_content
+    record_tier(TIER_PATH, "browser")
+    return scrape_with_browser()
+
+def find_video_list(html):
+    soup = make_soup(html, VIDEO_LIST_ONLY)
+    return soup.find("ul", class_="nf-videos videos search-video-thumbs")
+
+def listing_key(video_ul):
+    """The ordered video links of the listing; view counts change every run, links do not."""
+    links = [video.find("a", href=True) for video in video_ul.find_all("li", class_="pcVideoListItem")]
+    return "\n".join(a["href"] for a in links if a)
+
 def parse(html):
-    soup = BeautifulSoup(html, "html.parser")
-    video_ul = soup.find("ul", class_="nf-videos videos search-video-thumbs")
+    return parse_video_list(find_video_list(html))
 
+def parse_video_list(video_ul):
     videos = video_ul.find_all("li", class_="pcVideoListItem")
     video_data = []
 
@@ -65,7 +145,7 @@ def parse(html):
         })
     return video_data
 
-def send_telegram_messages(new_videos, bot_token, chat_id):
+def send_telegram_messages(new_videos, bot_token, chat_id, store):
     for video in reversed(new_videos):
         text = (
             f"<b>{html.escape(video['title'])}</b>\n"
@@ -74,8 +154,8 @@ def send_telegram_messages(new_videos, bot_token, chat_id):
             f"Duration: {video['duration']}\n"
             f"<code>https://www.pornhub.com/view_video.php?viewkey={html.escape(video['id'])}</code>"
         )
-        resp = requests.post(
-            f"https://api.telegram.org/bot{bot_token}/sendPhoto",
+        resp = get_client(bot_token).call(
+            "sendPhoto",
             data={
                 "chat_id": chat_id,
                 "photo": video["thumbnail"],
@@ -83,27 +163,40 @@ def send_telegram_messages(new_videos, bot_token, chat_id):
                 "parse_mode": "HTML",
             }
         )
+        if resp.status_code == 200:
+            store.add(SOURCE, video["id"], video)
+        else:
+            print(f"Telegram send failed for {video['id']}: {resp.text}")
 
 def main():
+    store = StateStore(SEEN_DB_PATH)
+    try:
+        store.migrate_json(SOURCE, OLD_PATH)
+        run(store)
+    finally:
+        store.close()
+
+def run(store):
     BOT_TOKEN = os.getenv("BOT_TOKEN")
     CHAT_ID = os.getenv("CHAT_ID")
 
-    html_ = scrape()
-    video_data = parse(html_)
-
-    if not os.path.exists(OLD_PATH):
-        old_data = []
-    else:
-        with open(OLD_PATH, "r", encoding="utf-8") as f:
-            old_data = json.load(f)
+    listing_cache = ListingCache(LISTING_CACHE_PATH)
+    html_ = scrape(listing_cache)
+    if html_ is NOT_MODIFIED:
+        print("Listing not modified since the last run.")
+        return
+    video_ul = find_video_list(html_)
+    if video_ul is not None and listing_cache.unchanged(url, listing_key(video_ul)):
+        print("Listing unchanged since the last run.")
+        listing_cache.finish(url)
+        return
+    video_data = parse_video_list(video_ul)
 
-    past_ids = {entry["id"] for entry in old_data}
-    new_videos = [v for v in video_data if v["id"] not in past_ids]
+    new_videos = [v for v in video_data if not store.contains(SOURCE, v["id"])]
 
     if new_videos:
-        send_telegram_messages(new_videos, BOT_TOKEN, CHAT_ID)
-        with open(OLD_PATH, "w", encoding="utf-8") as f:
-            json.dump(video_data, f, ensure_ascii=False, indent=2)
+        send_telegram_messages(new_videos, BOT_TOKEN, CHAT_ID, store)
+    listing_cache.finish(url, all(store.contains(SOURCE, v["id"]) for v in new_videos))
 
 if __name__ == "__main__":
     main()
@@ -1,4 +1,5 @@
 import os
+import sys
 import json
 import logging
 import requests
@@ -10,8 +11,11 @@ import shutil
 import mimetypes
 from urllib.parse import unquote, urlparse
 import base64
-from datetime import datetime
-import time
+import hashlib
+import threading
+import itertools
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 
 try:
     import yt_dlp
@@ -21,7 +25,21 @@ try:
     import redgifs
 except Exception:
     redgifs = None
+try:
+    import tomllib
+except ImportError:
+    import tomli as tomllib
  
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+from common.telegram import MultipartStream, get_client
+from common.media_cache import REDGIFS_ID_RE, FileIdCache, file_id_from_message, file_sha256, normalize_media_url
+from common.state import StateStore, pack_base36
+from common.media_dedup import MediaIndex, perceptual_hash
+from common.redgifs_client import RedgifsClient
+from common.ytdlp_client import YtdlpClient
+from common.media_route import DIRECT, REDGIFS, MediaRouter, looks_like_html
+
 load_dotenv()
 # Respect LOG_LEVEL environment variable (default INFO) so we can enable debug output during troubleshooting
 LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
@@ -29,19 +47,33 @@ logging.basicConfig(level=getattr(logging, LOG_LEVEL, logging.INFO), format="%(a
 logger = logging.getLogger(__name__)
 
 # === Config ===
-SUBREDDIT = "gonewildaudio"
-SUBREDDIT_POST_LIMIT = 50
-
-MULTIREDDIT_NAME = "lewds"
-MULTIREDDIT_POST_LIMIT = 100
-MULTIREDDIT_SORT = "hot"
-DELAY_SECONDS = 1
-BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# subreddits/multireddits to forward, with their sort, limit, filters and chat
+FEEDS_FILE = os.getenv("REDDIT_FEEDS_FILE", os.path.join(BASE_DIR, "reddit", "feeds.toml"))
+FEED_SORTS = ("hot", "new", "top", "rising", "controversial")
+# Feeds are fetched and sent by this many concurrent workers (one PRAW client each).
+FEED_CONCURRENCY = int(os.getenv("FEED_CONCURRENCY", "4"))
 DATA_DIR = os.path.join(BASE_DIR, "reddit", "data")
-OLD_FILE = os.path.join(DATA_DIR, "reddit_old.json")
-SEEN_FILE = os.path.join(DATA_DIR, "reddit_seen.json")
-MULTIREDDIT_SEEN_FILE = os.path.join(DATA_DIR, "reddit_multireddit_seen.json")
-MULTIREDDIT_OLD_FILE = os.path.join(DATA_DIR, "reddit_multireddit_old.json")
+# sent post ids live in the state database, one source per feed (see load_feeds)
+SEEN_DB_FILE = os.path.join(DATA_DIR, "state.db")
+# state from before feeds.toml: (old source, legacy JSON seen file, feed key it moves to)
+LEGACY_STATE = (
+    ("reddit", os.path.join(DATA_DIR, "reddit_seen.json"), "reddit:gonewildaudio"),
+    ("reddit_multireddit", os.path.join(DATA_DIR, "reddit_multireddit_seen.json"), "reddit:multi:lewds"),
+)
+# Seen ids are evicted least-recently-listed first: ids not listed for
+# SEEN_MAX_AGE_DAYS, then the oldest beyond SEEN_MAX_ENTRIES per source.
+SEEN_MAX_ENTRIES = int(os.getenv("SEEN_MAX_ENTRIES", "10000"))
+SEEN_MAX_AGE_DAYS = float(os.getenv("SEEN_MAX_AGE_DAYS", "180"))
+# Media already sent (same bytes, or a near-identical picture / first video frame) is
+# not uploaded again: "reference" posts the caption as a reply to the earlier message,
+# "skip" sends nothing, "off" disables the check.
+MEDIA_DUPLICATES = os.getenv("MEDIA_DUPLICATES", "reference").lower()
+MEDIA_INDEX_MAX_AGE_DAYS = float(os.getenv("MEDIA_INDEX_MAX_AGE_DAYS", "90"))
+MEDIA_SOURCE = "media"
+# Telegram file_ids of uploaded media, so crossposted media is sent without re-uploading
+FILE_ID_CACHE_FILE = os.path.join(DATA_DIR, "telegram_file_ids.json")
+FILE_ID_CACHE_MAX_ENTRIES = int(os.getenv("FILE_ID_CACHE_MAX_ENTRIES", "5000"))
+FILE_ID_CACHE_TTL_DAYS = float(os.getenv("FILE_ID_CACHE_TTL_DAYS", "30"))
 
 # Clear JSON state files at startup to allow resending during tests
 # Default: clear multireddit files each run to help manual testing
@@ -53,14 +85,30 @@ CLEAR_MULTIREDDIT_ON_START = os.getenv("CLEAR_MULTIREDDIT_ON_START", "false").lo
 # If enabled, the bot will clear seen/old JSON files when the repo commit hash changes.
 # Default: do NOT clear on code change unless explicitly enabled via env var.
 CLEAR_ON_CODECHANGE = os.getenv("CLEAR_ON_CODECHANGE", "false").lower() in ("1","true","yes")
-# If true, clear both subreddit and multireddit files on code change. Otherwise clear only multireddit files.
+# If true, clear the state of all feeds on code change. Otherwise clear only multireddit feeds.
 CLEAR_ALL_ON_CODECHANGE = os.getenv("CLEAR_ALL_ON_CODECHANGE", "false").lower() in ("1","true","yes")
 
+# Gallery items are downloaded concurrently: GALLERY_DOWNLOAD_WORKERS bounds the pool,
+# PER_HOST_DOWNLOAD_LIMIT caps simultaneous requests to a single host (i.redd.it etc.)
+GALLERY_DOWNLOAD_WORKERS = int(os.getenv("GALLERY_DOWNLOAD_WORKERS", "6"))
+PER_HOST_DOWNLOAD_LIMIT = int(os.getenv("PER_HOST_DOWNLOAD_LIMIT", "4"))
+# Posts are prepared (media downloaded) ahead of the Telegram upload stage:
+# PIPELINE_DEPTH bounds how many posts may be prepared/queued at once.
+PIPELINE_DEPTH = int(os.getenv("PIPELINE_DEPTH", "4"))
+PIPELINE_DOWNLOAD_WORKERS = int(os.getenv("PIPELINE_DOWNLOAD_WORKERS", "2"))
+# Stream direct media downloads straight into the Telegram upload instead of a temp file.
+# redgifs/yt-dlp downloads (and any stream that fails) still go through disk.
+STREAM_UPLOADS = os.getenv("STREAM_UPLOADS", "true").lower() in ("1","true","yes")
+STREAM_CHUNK_SIZE = 64 * 1024
+MAX_UPLOAD_BYTES = 50 * 1024 * 1024
+
 # file to persist last seen commit hash
 LAST_COMMIT_FILE = os.path.join(DATA_DIR if 'DATA_DIR' in globals() else ".", "last_code_hash.txt")
  
 # Whether to allow redgifs downloads. Default true (via redgifs API).
 ALLOW_REDGIFS = os.getenv("ALLOW_REDGIFS", "true").lower() in ("1","true","yes")
+# How long resolved Redgifs media URLs are reused before asking the API again (seconds).
+REDGIFS_URL_TTL = int(os.getenv("REDGIFS_URL_TTL", "3600"))
 
 # === Load Secrets ===
 REDDIT_CLIENT_ID = os.getenv("REDDIT_CLIENT_ID")
@@ -73,59 +121,136 @@ BOT_TOKEN = os.getenv("BOT_TOKEN")
 CHAT_ID = os.getenv("CHAT_ID")
 
 # === Init Reddit ===
-reddit = praw.Reddit(
-    client_id=REDDIT_CLIENT_ID,
-    client_secret=REDDIT_CLIENT_SECRET,
-    username=REDDIT_USERNAME,
-    password=REDDIT_PASSWORD,
-    user_agent=REDDIT_USER_AGENT
+# PRAW instances are not thread-safe; each feed worker gets its own
+_reddit_local = threading.local()
+
+def get_reddit():
+    client = getattr(_reddit_local, "client", None)
+    if client is None:
+        client = praw.Reddit(
+            client_id=REDDIT_CLIENT_ID,
+            client_secret=REDDIT_CLIENT_SECRET,
+            username=REDDIT_USERNAME,
+            password=REDDIT_PASSWORD,
+            user_agent=REDDIT_USER_AGENT
+        )
+        _reddit_local.client = client
+    return client
+
+# reuse a requests session for downloads; Telegram calls go through the shared pooled client
+session = requests.Session()
+# memoized host rules / first-bytes probe deciding which downloader a URL needs
+media_router = MediaRouter(session, REDDIT_USER_AGENT or "reddit-bot")
+telegram = get_client(BOT_TOKEN)
+file_id_cache = FileIdCache(FILE_ID_CACHE_FILE, max_entries=FILE_ID_CACHE_MAX_ENTRIES, ttl=FILE_ID_CACHE_TTL_DAYS * 86400)
+# fingerprints of sent media; set by main() once the state store is open
+media_index = None
+# one Redgifs API session (token, resolved URLs) shared by all downloads of a run
+redgifs_client = RedgifsClient(url_ttl=REDGIFS_URL_TTL)
+# shared yt-dlp extractors and info cache; cookies via env var: path or raw content
+ytdlp_client = YtdlpClient(
+    MAX_UPLOAD_BYTES,
+    cookies_path=os.getenv('YTDLP_COOKIES_PATH'),
+    cookies_content=os.getenv('YTDLP_COOKIES_CONTENT'),
 )
 
-# reuse a requests session for Telegram and downloads
-session = requests.Session()
+# Telegram send method for each media kind (the kind is also the form field name)
+SEND_METHODS = {
+    "photo": "sendPhoto",
+    "video": "sendVideo",
+    "animation": "sendAnimation",
+    "document": "sendDocument",
+}
 
 # === Helper Functions ===
 
-def safe_filename_from_url(url):
+def chat_for(post):
+    """Telegram chat a post goes to: its feed's chat_id, else CHAT_ID."""
+    return post.get("chat_id") or CHAT_ID
+
+def caption_for(post, show_subreddit=False):
+    """HTML caption of a post: title, author, score and permalink. With show_subreddit the
+    post's subreddit is added when its feed shows it (see post_to_dict)."""
+    text = (
+        f"<b>{html.escape(post['title'])}</b>\n"
+        f"👤 by <code>{html.escape(post['author'])}</code>\n"
+        f"👍 {post['score']} upvotes\n"
+    )
+    if show_subreddit and "subreddit" in post:
+        text += f"📍 r/{html.escape(post['subreddit'])}\n"
+    return text + f"<code>{html.escape(post['permalink'])}</code>"
+
+def safe_filename_from_url(url, content_type=None):
     path = urlparse(url).path
     name = os.path.basename(path) or "file"
     name = unquote(name)
-    # add extension if missing
+    # add extension if missing (content_type from a response we already have, else from the URL's route)
     if not os.path.splitext(name)[1]:
-        ext = mimetypes.guess_extension(session.head(url, allow_redirects=True).headers.get("content-type", "").split(";")[0])
+        if not content_type:
+            content_type = media_router.content_type(url) or ""
+        ext = mimetypes.guess_extension(content_type.split(";")[0].strip())
         if ext:
             name += ext
     return name
 
-def download_media(url, max_bytes=50 * 1024 * 1024):
-    """Download media to a temp file. Returns (path, content_type, size) or (None, None, 0) on failure/too large."""
+def open_media_stream(url, max_bytes=50 * 1024 * 1024):
+    """Start a streaming download of url and read its first chunk into memory.
+    Returns (resp, chunks, head, content_type, size): chunks iterates the rest of the body.
+    resp is None when the URL is unusable (request failed, HTML page or larger than max_bytes);
+    content_type/size then carry whatever the server reported.
+    """
     try:
         resp = session.get(url, stream=True, timeout=30, headers={"User-Agent": REDDIT_USER_AGENT or "reddit-bot"})
     except requests.RequestException as e:
         logger.exception("Download request failed for %s: %s", url, e)
-        return None, None, 0
+        return None, None, b"", None, 0
 
     if resp.status_code != 200:
         logger.error("Failed to download %s: status %s", url, resp.status_code)
-        return None, None, 0
+        resp.close()
+        return None, None, b"", None, 0
     content_type_header = (resp.headers.get("Content-Type") or "").lower()
     # If server returns an HTML page (common for embed/watch pages), skip here
     if content_type_header.startswith("text/html") or content_type_header.startswith("application/xhtml+xml"):
         logger.info("Remote URL %s returned HTML content-type (%s); skipping raw download so fallback extractors can run", url, content_type_header)
-        return None, content_type_header, 0
+        resp.close()
+        return None, None, b"", content_type_header, 0
 
     content_length = resp.headers.get("Content-Length")
     if content_length and int(content_length) > max_bytes:
         logger.info("Remote file too large (%s bytes) for upload limit", content_length)
-        return None, resp.headers.get("Content-Type"), int(content_length)
+        resp.close()
+        return None, None, b"", resp.headers.get("Content-Type"), int(content_length)
+
+    chunks = resp.iter_content(chunk_size=STREAM_CHUNK_SIZE)
+    head = b""
+    try:
+        for chunk in chunks:
+            if chunk:
+                head = chunk
+                break
+    except Exception:
+        logger.exception("Error while reading media from %s", url)
+        resp.close()
+        return None, None, b"", None, 0
+    return resp, chunks, head, resp.headers.get("Content-Type"), int(content_length) if content_length else None
+
+def download_media(url, max_bytes=50 * 1024 * 1024):
+    """Download media to a temp file. Returns (path, content_type, size) or (None, None, 0) on failure/too large."""
+    resp, chunks, head, content_type, size = open_media_stream(url, max_bytes)
+    if resp is None:
+        return None, content_type, size
+    return save_stream(url, resp, chunks, head, content_type, max_bytes)
 
+def save_stream(url, resp, chunks, head, content_type, max_bytes=50 * 1024 * 1024):
+    """Write a stream opened by open_media_stream to a temp file. Returns like download_media."""
     tmp_dir = tempfile.mkdtemp(prefix="reddit_media_")
-    filename = safe_filename_from_url(url)
+    filename = safe_filename_from_url(url, content_type)
     tmp_path = os.path.join(tmp_dir, filename)
     total = 0
     try:
-        with open(tmp_path, "wb") as f:
-            for chunk in resp.iter_content(chunk_size=8192):
+        with resp, open(tmp_path, "wb") as f:
+            for chunk in itertools.chain([head], chunks):
                 if not chunk:
                     continue
                 total += len(chunk)
@@ -133,74 +258,21 @@ def download_media(url, max_bytes=50 * 1024 * 1024):
                     logger.info("Downloaded size exceeded max (%d bytes). Aborting.", total)
                     f.close()
                     shutil.rmtree(tmp_dir, ignore_errors=True)
-                    return None, resp.headers.get("Content-Type"), total
+                    return None, content_type, total
                 f.write(chunk)
-        return tmp_path, resp.headers.get("Content-Type"), total
+        return tmp_path, content_type, total
     except Exception:
         logger.exception("Error while saving media from %s", url)
         shutil.rmtree(tmp_dir, ignore_errors=True)
         return None, None, 0
 
-def ytdlp_download(url, max_bytes=50 * 1024 * 1024):
-    """Use yt-dlp to download a URL into a temp directory. Returns (path, content_type, size) or (None,None,0)."""
+def ytdlp_download(url):
+    """Use yt-dlp to download a URL into a temp directory, picking a format under MAX_UPLOAD_BYTES.
+    Returns (path, content_type, size) or (None,None,0)."""
     if not yt_dlp:
         logger.warning("yt-dlp not available; skipping ytdlp download for %s", url)
         return None, None, 0
-
-    tmp_dir = tempfile.mkdtemp(prefix="ytdlp_media_")
-    ydl_opts = {
-        'outtmpl': os.path.join(tmp_dir, '%(id)s.%(ext)s'),
-        'noplaylist': True,
-        'quiet': True,
-        'no_warnings': True,
-        'ignoreerrors': True,
-    }
-    # support cookies via env var: path or raw content
-    cookies_path = os.getenv('YTDLP_COOKIES_PATH')
-    cookies_content = os.getenv('YTDLP_COOKIES_CONTENT')
-    temp_cookie_file = None
-    if cookies_content and not cookies_path:
-        # write content to a temp cookie file
-        temp_cookie_file = os.path.join(tmp_dir, 'cookies.txt')
-        try:
-            with open(temp_cookie_file, 'w', encoding='utf-8') as cf:
-                cf.write(cookies_content)
-            cookies_path = temp_cookie_file
-        except Exception:
-            logger.exception('Failed to write yt-dlp cookie content to temp file')
-            cookies_path = None
-    if cookies_path:
-        ydl_opts['cookiefile'] = cookies_path
-    try:
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            info = ydl.extract_info(url, download=True)
-            # info may be a dict or list; handle dict
-            if not info:
-                return None, None, 0
-            # find downloaded filename: check _filename or use id/ext
-            if isinstance(info, dict):
-                fn = ydl.prepare_filename(info)
-            else:
-                fn = None
-            # if file exists, return it
-            if fn and os.path.exists(fn):
-                size = os.path.getsize(fn)
-                if size > max_bytes:
-                    shutil.rmtree(tmp_dir, ignore_errors=True)
-                    return None, None, size
-                ctype, _ = mimetypes.guess_type(fn)
-                return fn, ctype, size
-    except Exception:
-        logger.exception("yt-dlp failed to download %s", url)
-    # nothing found
-    # cleanup cookie file if we created one
-    if temp_cookie_file and os.path.exists(temp_cookie_file):
-        try:
-            os.remove(temp_cookie_file)
-        except Exception:
-            pass
-    shutil.rmtree(tmp_dir, ignore_errors=True)
-    return None, None, 0
+    return ytdlp_client.download(url)
 
 def redgifs_download(url, max_bytes=50 * 1024 * 1024):
     """Extract and download a Redgifs video using the redgifs API. Returns (path, content_type, size) or (None,None,0)."""
@@ -208,229 +280,287 @@ def redgifs_download(url, max_bytes=50 * 1024 * 1024):
         logger.warning("redgifs library not available; skipping redgifs download for %s", url)
         return None, None, 0
 
-    tmp_dir = None
-    api = None
-    keep_tmp = False
-    try:
-        # Extract ID from URL: https://redgifs.com/watch/abcxyz or https://www.redgifs.com/watch/abcxyz
-        parsed = urlparse(url)
-        path_parts = parsed.path.strip('/').split('/')
-        if len(path_parts) < 2 or path_parts[0] not in ('watch', 'gifs'):
-            logger.warning("Could not extract Redgifs ID from %s", url)
-            return None, None, 0
-        gif_id = path_parts[1]
-
-        # Initialize and login to Redgifs API
-        api = redgifs.API()
-        api.login()
-        
-        # Fetch the GIF details
-        gif = api.get_gif(gif_id)
-        if not gif or not gif.urls:
-            logger.warning("Could not fetch Redgifs GIF details for ID %s", gif_id)
-            api.close()
-            return None, None, 0
-
-        # Build a prioritized list of candidate direct URLs
-        urls = []
-        try:
-            u = gif.urls
-            # helper to extract attribute or dict key
-            def ex(k):
-                try:
-                    return getattr(u, k)
-                except Exception:
-                    try:
-                        return u.get(k)
-                    except Exception:
-                        return None
-
-            # Try the common fields and some alternates
-            candidates = [
-                'file_url', 'mp4', 'mp4_url', 'mp4Url', 'mp4UrlHttps',
-                'hd', 'hd_url', 'hd_mp4', 'sd', 'sd_url', 'gifv',
-                'embed_url', 'web_url', 'webm', 'poster'
-            ]
-            for k in candidates:
-                v = ex(k)
-                if v:
-                    # normalize strings and add unique entries
-                    if isinstance(v, str):
-                        if v not in urls:
-                            urls.append(v)
-                    elif isinstance(v, (list, tuple)):
-                        for item in v:
-                            if item and item not in urls:
-                                urls.append(item)
-        except Exception:
-            urls = []
-
-        if not urls:
-            logger.warning("No candidate URLs available for Redgifs GIF %s", gif_id)
-            api.close()
-            return None, None, 0
-
-        # debug: list candidates
-        logger.debug("Redgifs candidates for %s: %s", gif_id, urls)
-
-        tmp_dir = tempfile.mkdtemp(prefix="redgifs_media_")
-        tmp_path = os.path.join(tmp_dir, f"{gif_id}.mp4")
+    # Extract ID from URL: https://redgifs.com/watch/abcxyz or https://www.redgifs.com/watch/abcxyz
+    m = REDGIFS_ID_RE.search(urlparse(url).path)
+    if not m:
+        logger.warning("Could not extract Redgifs ID from %s", url)
+        return None, None, 0
+    gif_id = m.group(1)
 
-        # Try each candidate URL until we get a non-HTML media file
-        for candidate in urls:
-            if not candidate:
-                continue
+    try:
+        candidates = redgifs_client.media_urls(gif_id)
+    except Exception:
+        logger.exception("Redgifs extraction failed for %s", url)
+        return None, None, 0
+    if not candidates:
+        logger.warning("No candidate URLs available for Redgifs GIF %s", gif_id)
+        return None, None, 0
+    logger.debug("Redgifs candidates for %s: %s", gif_id, candidates)
+
+    tmp_dir = tempfile.mkdtemp(prefix="redgifs_media_")
+    tmp_path = os.path.join(tmp_dir, f"{gif_id}.mp4")
+    too_large = 0
+    for field, candidate in candidates:
+        # a field that downloaded fine before is fetched straight away; others are
+        # checked with a HEAD first so watch/embed pages and oversized files are skipped
+        if field != redgifs_client.good_field:
             try:
-                # Inspect candidate first with a lightweight HEAD request to avoid HTML pages
-                logger.info("Trying Redgifs candidate URL for %s: %s", gif_id, candidate)
-                try:
-                    head_resp = session.head(candidate, allow_redirects=True, timeout=10, headers={"User-Agent": REDDIT_USER_AGENT or "reddit-bot"})
-                    head_ct = (head_resp.headers.get("Content-Type") or "").lower()
-                    head_len = head_resp.headers.get("Content-Length")
-                except Exception:
-                    head_resp = None
-                    head_ct = ""
-                    head_len = None
-
-                logger.debug("Candidate HEAD for %s -> content-type=%s, content-length=%s", candidate, head_ct, head_len)
-
-                # If the head indicates HTML, skip this candidate (it's likely a watch/embed page)
-                if head_ct.startswith("text/html") or "<html" in candidate.lower() or "/watch/" in candidate.lower():
-                    logger.info("Skipping candidate %s because it appears to be an HTML page (content-type=%s)", candidate, head_ct)
-                    continue
-
-                # If the server advertises a content-length above our limit, skip/return
-                if head_len:
-                    try:
-                        if int(head_len) > max_bytes:
-                            logger.info("Remote file too large (head content-length=%s) for upload limit", head_len)
-                            api.close()
-                            shutil.rmtree(tmp_dir, ignore_errors=True)
-                            return None, None, int(head_len)
-                    except Exception:
-                        pass
-
-                # Use the library download helper where possible (after basic head checks)
-                api.download(candidate, tmp_path)
-
-                if not os.path.exists(tmp_path):
-                    continue
-
-                # quick sanity check: detect HTML saved instead of media
-                try:
-                    with open(tmp_path, 'rb') as fh:
-                        head = fh.read(1024)
-                except Exception:
-                    head = b''
-
-                # if file looks like HTML, skip
-                try:
-                    head_text = head.decode('utf-8', errors='ignore').lower()
-                except Exception:
-                    head_text = ''
-                if '<!doctype' in head_text or '<html' in head_text or '<script' in head_text:
-                    logger.warning("Redgifs candidate %s returned HTML (not media); trying next", candidate)
-                    try:
-                        os.remove(tmp_path)
-                    except Exception:
-                        pass
-                    continue
-
-                size = os.path.getsize(tmp_path)
-                if size > max_bytes:
-                    logger.info("Redgifs video too large (%d bytes) for upload limit", size)
-                    try:
-                        os.remove(tmp_path)
-                    except Exception:
-                        pass
-                    shutil.rmtree(tmp_dir, ignore_errors=True)
-                    api.close()
-                    return None, None, size
-
-                logger.info("Downloaded Redgifs video %s (%d bytes) from candidate", gif_id, size)
-                # caller will take ownership of the downloaded file — don't delete it here
-                keep_tmp = True
-                return tmp_path, "video/mp4", size
+                head_resp = session.head(candidate, allow_redirects=True, timeout=10, headers={"User-Agent": REDDIT_USER_AGENT or "reddit-bot"})
+                head_ct = (head_resp.headers.get("Content-Type") or "").lower()
+                head_len = head_resp.headers.get("Content-Length")
             except Exception:
-                logger.exception("Failed to download Redgifs candidate %s for %s", candidate, gif_id)
-                # remove possibly-bad file and continue
-                try:
-                    if os.path.exists(tmp_path):
-                        os.remove(tmp_path)
-                except Exception:
-                    pass
+                head_ct = ""
+                head_len = None
+            logger.debug("Candidate HEAD for %s -> content-type=%s, content-length=%s", candidate, head_ct, head_len)
+            if head_ct.startswith("text/html") or "/watch/" in candidate.lower():
+                logger.info("Skipping candidate %s because it appears to be an HTML page (content-type=%s)", candidate, head_ct)
+                continue
+            if head_len and head_len.isdigit() and int(head_len) > max_bytes:
+                logger.info("Redgifs %s candidate too large (content-length=%s) for upload limit", field, head_len)
+                too_large = int(head_len)
+                continue
 
-        # nothing worked
-        # fall through to cleanup below
-    except Exception:
-        logger.exception("Redgifs extraction failed for %s", url)
-    finally:
-        # ensure resources are cleaned when we did not return a file
+        logger.info("Downloading Redgifs %s (%s): %s", gif_id, field, candidate)
         try:
-            if api:
-                try:
-                    api.close()
-                except Exception:
-                    pass
+            redgifs_client.download(candidate, tmp_path)
+            with open(tmp_path, 'rb') as fh:
+                head = fh.read(1024)
         except Exception:
-            pass
-        # if tmp_dir exists but we did not return, remove it (if we returned we set keep_tmp=True)
-        try:
-            # if we returned earlier, tmp_dir still exists but caller will remove it
-            # only remove tmp_dir if it still contains the mp4 and we didn't return (no mp4 created)
-            if tmp_dir and os.path.exists(tmp_dir) and not keep_tmp:
-                # if directory is empty or contains non-media, safe to remove
-                shutil.rmtree(tmp_dir, ignore_errors=True)
-        except Exception:
-            pass
-    return None, None, 0
+            logger.exception("Failed to download Redgifs candidate %s for %s", candidate, gif_id)
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            continue
+
+        if looks_like_html(head):
+            logger.warning("Redgifs candidate %s returned HTML (not media); trying next", candidate)
+            os.remove(tmp_path)
+            continue
+        size = os.path.getsize(tmp_path)
+        if size > max_bytes:
+            logger.info("Redgifs video too large (%d bytes) for upload limit", size)
+            too_large = size
+            os.remove(tmp_path)
+            continue
+
+        redgifs_client.worked(gif_id, field)
+        logger.info("Downloaded Redgifs video %s (%d bytes) from %s", gif_id, size, field)
+        # caller takes ownership of the downloaded file
+        return tmp_path, "video/mp4", size
+
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    return None, None, too_large
+
+_host_semaphores = {}
+_host_semaphores_lock = threading.Lock()
+
+def host_semaphore(url):
+    """Return the shared semaphore limiting concurrent downloads from the host of url."""
+    host = urlparse(url).netloc.lower()
+    with _host_semaphores_lock:
+        sem = _host_semaphores.get(host)
+        if sem is None:
+            sem = threading.BoundedSemaphore(max(1, PER_HOST_DOWNLOAD_LIMIT))
+            _host_semaphores[host] = sem
+    return sem
+
+def download_gallery_item(url):
+    """Download one gallery item (direct unless routed to an extractor, then yt-dlp). Returns a file path or None."""
+    try:
+        route = media_router.route(url)
+        with host_semaphore(url):
+            pth = None
+            if route.kind == DIRECT:
+                pth, ctype, sz = download_media(route.url)
+            if not pth:
+                pth, ctype, sz = ytdlp_download(url)
+        return pth
+    except Exception:
+        logger.exception("Gallery item download failed for %s", url)
+        return None
+
+def url_cache_key(url):
+    norm = normalize_media_url(url)
+    return f"url:{norm}" if norm else None
+
+def sha_cache_key(sha):
+    return f"sha256:{sha}" if sha else None
+
+def dedup_enabled():
+    return media_index is not None and MEDIA_DUPLICATES != "off"
+
+def remember_upload(url, sha, message, kind, phash=None):
+    """Store the file_id Telegram returned for an upload under its URL and content hash,
+    and index the message by the media's fingerprints."""
+    file_id = file_id_from_message(message, kind)
+    if media_index is not None:
+        media_index.remember(sha, phash, message, kind, file_id)
+    if not file_id:
+        return
+    file_id_cache.put(url_cache_key(url), file_id, kind)
+    file_id_cache.put(sha_cache_key(sha), file_id, kind)
+
+def find_uploaded(url, sha=None, phash=None, kinds=SEND_METHODS):
+    """Look for an earlier upload of url's media: by URL in the file_id cache, then by
+    fingerprint in the media index (see MEDIA_DUPLICATES), then by identical bytes.
+    Only uploads sent as one of kinds match. Returns a prepared dict of kind 'duplicate'
+    or 'cached', or None."""
+    entry = file_id_cache.get(url_cache_key(url))
+    if entry and entry.get("kind") in kinds:
+        logger.debug("file_id cache hit for %s", url)
+        record = media_index.lookup_file_id(entry["file_id"]) if dedup_enabled() else None
+        if record:
+            return {"kind": "duplicate", "url": url, "duplicate": record}
+        return {"kind": "cached", "url": url, "file_id": entry["file_id"], "file_kind": entry["kind"]}
+    if sha and dedup_enabled():
+        record = media_index.lookup(sha, phash)
+        if record and record.get("kind") in kinds and record.get("file_id"):
+            logger.info("Media of %s was already sent in message %s", url, record.get("message_id"))
+            return {"kind": "duplicate", "url": url, "duplicate": record}
+    if sha:
+        entry = file_id_cache.get(sha_cache_key(sha))
+        if entry and entry.get("kind") in kinds:
+            logger.info("Content of %s matches an earlier upload; reusing file_id", url)
+            file_id_cache.put(url_cache_key(url), entry["file_id"], entry["kind"])
+            return {"kind": "cached", "url": url, "file_id": entry["file_id"], "file_kind": entry["kind"]}
+    return None
+
+def match_downloaded(url, path, kinds, content_type=None):
+    """Fingerprint a downloaded file and look for an earlier upload of the same media.
+    Returns (fingerprint, found): fingerprint is {"sha256", "phash"}; found is None or
+    what find_uploaded returned, in which case the file is removed."""
+    try:
+        sha = file_sha256(path)
+    except Exception:
+        logger.exception("Failed to hash %s", path)
+        return {"sha256": None, "phash": None}, None
+    fingerprint = {"sha256": sha, "phash": None}
+    if dedup_enabled():
+        fingerprint["phash"] = perceptual_hash(path, content_type)
+    found = find_uploaded(url, sha, fingerprint["phash"], kinds)
+    if found:
+        shutil.rmtree(os.path.dirname(path), ignore_errors=True)
+    return fingerprint, found
+
+def album_item(url, found):
+    """Album item referencing an earlier upload found by find_uploaded."""
+    item = {"url": url, "file_id": found["file_id"] if found["kind"] == "cached" else found["duplicate"]["file_id"]}
+    if found["kind"] == "duplicate":
+        item["duplicate"] = found["duplicate"]
+    return item
+
+def album_prepared(album):
+    """Prepared dict for gallery items; a gallery whose every item was already sent is a duplicate."""
+    if album and all(item.get("duplicate") for item in album):
+        return {"kind": "duplicate", "duplicate": album[0]["duplicate"], "album": album}
+    if album:
+        return {"kind": "album", "album": album}
+    return {"kind": None}
+
+def download_gallery(urls):
+    """Download up to 10 gallery items concurrently.
+    Returns album items in album order: {"url", "path", "sha256", "phash"} for fresh
+    downloads or {"url", "file_id"} for images already known to Telegram (with the
+    earlier message's record as "duplicate" when already sent); failed items are dropped.
+    Only returns once every item has finished or failed.
+    """
+    urls = [u for u in urls[:10] if u]
+    if not urls:
+        return []
+    items = [None] * len(urls)
+    to_fetch = []
+    for i, url in enumerate(urls):
+        found = find_uploaded(url, kinds=("photo",))
+        if found:
+            items[i] = album_item(url, found)
+        else:
+            to_fetch.append(i)
+    if to_fetch:
+        workers = max(1, min(GALLERY_DOWNLOAD_WORKERS, len(to_fetch)))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="gallery") as pool:
+            paths = list(pool.map(download_gallery_item, [urls[i] for i in to_fetch]))
+        for i, path in zip(to_fetch, paths):
+            if not path:
+                continue
+            fingerprint, found = match_downloaded(urls[i], path, ("photo",))
+            if found:
+                items[i] = album_item(urls[i], found)
+            else:
+                items[i] = {"url": urls[i], "path": path, "sha256": fingerprint["sha256"], "phash": fingerprint["phash"]}
+    items = [it for it in items if it]
+    logger.debug("Prepared %d/%d gallery items (%d downloaded)", len(items), len(urls), len(to_fetch))
+    return items
 
 def telegram_send_file(file_path, file_field, method, extra_data):
     """Upload a single file to Telegram using multipart/form-data.
     file_field: 'photo', 'video', 'animation', or 'document'
     method: API method name, e.g., 'sendPhoto' (without base URL)
     extra_data: dict of other form fields (chat_id, caption, parse_mode, etc.)
+    Returns the sent Message dict on success, None otherwise.
     """
-    url = f"https://api.telegram.org/bot{BOT_TOKEN}/{method}"
     try:
         with open(file_path, "rb") as fh:
             files = {file_field: fh}
-            r = requests.post(url, data=extra_data, files=files, timeout=60)
+            r = telegram.call(method, data=extra_data, files=files, timeout=60)
         if r.status_code != 200:
             logger.error("Telegram %s returned %s: %s", method, r.status_code, r.text)
+            return None
+        return r.json().get("result") or {}
+    except Exception:
+        logger.exception("Failed to upload file to Telegram")
+        return None
+
+def telegram_send_file_id(file_id, kind, extra_data):
+    """Send media Telegram already stores, by file_id. Returns True on success."""
+    method = SEND_METHODS.get(kind, "sendDocument")
+    data = dict(extra_data)
+    data[kind] = file_id
+    try:
+        r = telegram.call(method, data=data, timeout=30)
+        if r.status_code != 200:
+            logger.warning("Telegram %s with cached file_id returned %s: %s", method, r.status_code, r.text)
             return False
         return True
     except Exception:
-        logger.exception("Failed to upload file to Telegram")
+        logger.exception("Failed to send cached file_id to Telegram")
         return False
 
 
-def send_album(paths, post, source):
-    """Send multiple images as an album (media group). paths: list of file paths."""
-    if not paths:
+def send_album(album, post, source):
+    """Send multiple images as an album (media group).
+    album: items from download_gallery (each with a local 'path' or a cached 'file_id').
+    """
+    if not album:
         return False
     # Telegram allows up to 10 media in an album
+    album = album[:10]
     items = []
     files = {}
-    for i, path in enumerate(paths[:10]):
-        attach = f'file{i}'
-        # all photos for album
-        item = {"type": "photo", "media": f"attach://{attach}"}
+    for i, entry in enumerate(album):
+        # all photos for album; cached ones are referenced by file_id instead of uploaded
+        if entry.get("file_id"):
+            item = {"type": "photo", "media": entry["file_id"]}
+        else:
+            attach = f'file{i}'
+            item = {"type": "photo", "media": f"attach://{attach}"}
+            files[attach] = open(entry["path"], 'rb')
         # add caption only to first item
         if i == 0:
-            item["caption"] = f"<b>{html.escape(post['title'])}</b>\n👤 by <code>{html.escape(post['author'])}</code>\n👍 {post['score']} upvotes\n<code>{html.escape(post['permalink'])}</code>"
+            item["caption"] = caption_for(post)
             item["parse_mode"] = "HTML"
         items.append(item)
-        files[attach] = open(path, 'rb')
 
-    url = f"https://api.telegram.org/bot{BOT_TOKEN}/sendMediaGroup"
-    data = {"chat_id": CHAT_ID, "media": json.dumps(items)}
+    data = {"chat_id": chat_for(post), "media": json.dumps(items)}
     try:
-        r = requests.post(url, data=data, files=files, timeout=60)
+        # each album item counts against Telegram's message limits
+        r = telegram.call("sendMediaGroup", data=data, files=files or None, timeout=60, cost=len(items))
         if r.status_code != 200:
             logger.error("sendMediaGroup returned %s: %s", r.status_code, r.text)
             return False
-        logger.info("Uploaded album for %s post %s", source, post['id'])
+        messages = r.json().get("result") or []
+        for entry, message in zip(album, messages):
+            if entry.get("path"):
+                remember_upload(entry["url"], entry.get("sha256"), message, "photo", entry.get("phash"))
+        logger.info("Uploaded album for %s post %s (%d cached items)", source, post['id'], len(album) - len(files))
         return True
     except Exception:
         logger.exception("Failed to upload album to Telegram")
@@ -441,31 +571,40 @@ def send_album(paths, post, source):
                 f.close()
             except Exception:
                 pass
-        # cleanup paths directory
-        try:
-            shutil.rmtree(os.path.dirname(paths[0]), ignore_errors=True)
-        except Exception:
-            pass
-
-def send_media(post, media_url, mime, source):
-    """Download media and upload to Telegram. Returns True on success."""
-    if not media_url:
-        return False
-    
-    # first try a simple direct download (may return HTML if it's a link page)
-    path, content_type, size = download_media(media_url)
+        # cleanup: every item was downloaded into its own temp directory
+        discard_prepared({"album": album})
+
+def media_kind(content_type):
+    """Telegram media kind ('photo', 'animation', 'video' or 'document') for a content type."""
+    lower_ct = (content_type or "").lower()
+    if lower_ct.startswith("image/"):
+        return "animation" if lower_ct == "image/gif" else "photo"
+    if lower_ct.startswith("video/"):
+        return "video"
+    # Unknown type -> sendDocument
+    return "document"
+
+def resolve_media(media_url, try_direct=True):
+    """Download media_url with the downloader its route calls for, falling back to yt-dlp.
+    try_direct=False skips the plain download (already attempted by upload_stream).
+    Returns (path, content_type, size, download_source); path is None on failure/too large.
+    """
+    route = media_router.route(media_url)
+    path, content_type, size = None, None, 0
     download_source = 'direct'
+    if try_direct and route.kind == DIRECT:
+        # a file URL by host rules or probe (may still turn out to be HTML if headers lied)
+        path, content_type, size = download_media(route.url)
     # If direct download returned a file, sanity-check it for HTML even when headers lied
     if path:
         try:
             # read a small head to check for HTML
             with open(path, 'rb') as fh:
                 head = fh.read(2048)
-            head_text = head.decode('utf-8', errors='ignore').lower()
         except Exception:
-            head_text = ''
+            head = b''
 
-        if '<!doctype' in head_text or '<html' in head_text or '<script' in head_text:
+        if looks_like_html(head):
             logger.info("Direct download of %s resulted in HTML content — rejecting file and trying extractors", media_url)
             try:
                 shutil.rmtree(os.path.dirname(path), ignore_errors=True)
@@ -475,10 +614,9 @@ def send_media(post, media_url, mime, source):
 
     if not path:
         # Try Redgifs extraction if it's a Redgifs URL and library available
-        host = urlparse(media_url).netloc.lower()
-        if ("redgifs" in host or "redgif" in host) and ALLOW_REDGIFS:
+        if route.kind == REDGIFS and ALLOW_REDGIFS:
             logger.info("Attempting Redgifs extraction for %s", media_url)
-            path, content_type, size = redgifs_download(media_url)
+            path, content_type, size = redgifs_download(route.url)
             download_source = 'redgifs'
         
         # Fallback to yt-dlp for other complex hosts
@@ -488,43 +626,40 @@ def send_media(post, media_url, mime, source):
             path, content_type, size = ytdlp_download(media_url)
             download_source = 'yt-dlp'
         
-        if not path:
-            # either too large (size set) or download failed
-            if size and size > 0:
-                logger.info("Media too large to upload (%d bytes). Falling back to sending link.", size)
-            return False
+        if not path and size and size > 0:
+            logger.info("Media too large to upload (%d bytes). Falling back to sending link.", size)
 
+    return path, content_type, size, download_source
+
+def upload_media(post, prepared, source):
+    """Upload an already downloaded media file to Telegram and remove it. Returns True on success."""
+    path = prepared["path"]
+    size = prepared.get("size")
+    download_source = prepared.get("download_source")
     # decide send method based on mime/type or extension
-    ct = content_type or mimetypes.guess_type(path)[0] or ""
+    ct = prepared.get("content_type") or mimetypes.guess_type(path)[0] or ""
     lower_ct = ct.lower()
     extra = {
-        "chat_id": CHAT_ID,
+        "chat_id": chat_for(post),
         "parse_mode": "HTML",
         "disable_web_page_preview": True
     }
-    caption = f"<b>{html.escape(post['title'])}</b>\n👤 by <code>{html.escape(post['author'])}</code>\n👍 {post['score']} upvotes\n<code>{html.escape(post['permalink'])}</code>"
-    extra["caption"] = caption
+    extra["caption"] = caption_for(post)
 
-    success = False
+    message = None
+    kind = None
 
     logger.debug("Uploading media (source=%s) path=%s content_type=%s size=%s", download_source, path, ct, size)
 
     # Try appropriate send method. If an image fails (PHOTO_INVALID_DIMENSIONS),
     # try sending as a document as a fallback.
     try:
-        if lower_ct.startswith("image/"):
-            if lower_ct == "image/gif":
-                success = telegram_send_file(path, "animation", f"sendAnimation", extra)
-            else:
-                success = telegram_send_file(path, "photo", f"sendPhoto", extra)
-            if not success:
-                logger.info("Image upload failed for post %s; trying as document", post['id'])
-                success = telegram_send_file(path, "document", f"sendDocument", extra)
-        elif lower_ct.startswith("video/"):
-            success = telegram_send_file(path, "video", f"sendVideo", extra)
-        else:
-            # Unknown type -> try sendDocument
-            success = telegram_send_file(path, "document", f"sendDocument", extra)
+        kind = media_kind(lower_ct)
+        message = telegram_send_file(path, kind, SEND_METHODS[kind], extra)
+        if message is None and kind in ("photo", "animation"):
+            logger.info("Image upload failed for post %s; trying as document", post['id'])
+            kind = "document"
+            message = telegram_send_file(path, kind, SEND_METHODS[kind], extra)
     except Exception:
         logger.exception("Exception while sending media for post %s", post['id'])
     finally:
@@ -534,212 +669,455 @@ def send_media(post, media_url, mime, source):
         except Exception:
             pass
 
+    success = message is not None
     if not success:
         logger.error("Failed to send media for post %s; falling back to link", post['id'])
     else:
+        remember_upload(prepared.get("url"), prepared.get("sha256"), message, kind, prepared.get("phash"))
         logger.info("Uploaded media for %s post %s", source, post['id'])
     return success
 
-def send_telegram(post, source="subreddit"):
-    """Send a post to Telegram. Try to upload media if available, otherwise send formatted text/link."""
-    # Basic text (used as fallback caption too)
-    text = (
-        f"<b>{html.escape(post['title'])}</b>\n"
-        f"👤 by <code>{html.escape(post['author'])}</code>\n"
-        f"👍 {post['score']} upvotes\n"
-    )
-    if "subreddit" in post:
-        text += f"📍 r/{html.escape(post['subreddit'])}\n"
-    text += f"<code>{html.escape(post['permalink'])}</code>"
-
-    if not BOT_TOKEN or not CHAT_ID:
-        logger.error("BOT_TOKEN or CHAT_ID not set; cannot send message")
+def send_cached_media(post, prepared, source):
+    """Send a post's media by the file_id of an earlier identical upload."""
+    extra = {
+        "chat_id": chat_for(post),
+        "parse_mode": "HTML",
+        "caption": caption_for(post),
+    }
+    ok = telegram_send_file_id(prepared["file_id"], prepared["file_kind"], extra)
+    if ok:
+        logger.info("Sent %s post %s using cached file_id", source, post['id'])
+    return ok
+
+def same_chat(record, post):
+    """True if the media-index record was sent to the chat post goes to."""
+    chat = str(chat_for(post)).lower()
+    sent_to = {str(record.get("chat_id"))}
+    if record.get("chat_username"):
+        sent_to.add("@" + record["chat_username"].lower())
+    return chat in sent_to
+
+def send_duplicate(post, prepared, source):
+    """Handle a post whose media was already sent: per MEDIA_DUPLICATES, skip it or
+    post its caption as a reply to the earlier message instead of uploading again.
+    Media sent to another chat (a different feed's) is re-sent there by file_id."""
+    record = prepared["duplicate"]
+    if not same_chat(record, post):
+        logger.info("Media of %s post %s was sent to another chat; re-sending it by file_id", source, post['id'])
+        if prepared.get("album"):
+            return send_album(prepared["album"], post, source)
+        return send_cached_media(post, {"file_id": record["file_id"], "file_kind": record["kind"]}, source)
+    if MEDIA_DUPLICATES == "skip":
+        logger.info("Skipping %s post %s: media already sent in message %s", source, post['id'], record.get("message_id"))
+        return True
+    payload = {
+        "chat_id": chat_for(post),
+        "text": caption_for(post) + "\n🔁 repost",
+        "parse_mode": "HTML",
+        "disable_web_page_preview": True,
+    }
+    if record.get("message_id"):
+        payload["reply_parameters"] = {"message_id": record["message_id"], "allow_sending_without_reply": True}
+    try:
+        r = telegram.call("sendMessage", json=payload, timeout=10)
+        if r.status_code != 200:
+            logger.warning("Repost reference for post %s returned %s: %s", post['id'], r.status_code, r.text)
+            return False
+        logger.info("Sent %s post %s as a reply to earlier message %s", source, post['id'], record.get("message_id"))
+        return True
+    except Exception:
+        logger.exception("Failed to send repost reference for post %s", post['id'])
         return False
 
-    # Attempt to detect media info on the post dict
-    # priority: reddit video -> gallery -> direct url
-    media_sent = False
+def prepare_stream(media_url, fetch_url=None, content_type=None):
+    """Plan a direct download to be streamed straight into the upload. Nothing is opened
+    yet: a response left half-read while the post waits in the look-ahead queue would
+    time out, so upload_stream opens it once the post is being uploaded.
+    fetch_url is where the file is actually served, if not at media_url.
+    """
+    return {
+        "kind": "stream",
+        "url": media_url,
+        "fetch_url": fetch_url or media_url,
+        "content_type": content_type or mimetypes.guess_type(urlparse(fetch_url or media_url).path)[0],
+    }
+
+def upload_stream(post, prepared, source):
+    """Pipe a streaming download straight into a multipart upload.
+    Falls back to the temp-file path if the stream cannot be used or the upload fails.
+    """
+    url = prepared["url"]
+    fetch_url = prepared["fetch_url"]
+    resp, chunks, head, content_type, size = open_media_stream(fetch_url, MAX_UPLOAD_BYTES)
+    if resp is not None and looks_like_html(head):
+        logger.info("Direct download of %s resulted in HTML content — rejecting stream and trying extractors", url)
+        resp.close()
+        resp = None
+    if resp is None:
+        # the direct download was just attempted; go straight to the extractors
+        return upload_prepared(post, prepare_media(url, stream=False, try_direct=False), source)
+
+    ct = content_type or prepared["content_type"] or ""
+    kind = media_kind(ct)
+    digest = hashlib.sha256()
+    total = 0
+
+    def body_chunks():
+        nonlocal total
+        for chunk in itertools.chain([head], chunks):
+            if not chunk:
+                continue
+            total += len(chunk)
+            if total > MAX_UPLOAD_BYTES:
+                raise IOError(f"stream exceeded {MAX_UPLOAD_BYTES} bytes")
+            digest.update(chunk)
+            yield chunk
+
+    fields = {
+        "chat_id": chat_for(post),
+        "parse_mode": "HTML",
+        "caption": caption_for(post),
+    }
+    body = MultipartStream(fields, kind, safe_filename_from_url(fetch_url, ct), ct, body_chunks(), size)
+    ok = False
     try:
-        # reddit hosted video
-        if post.get("is_video") and post.get("video_url"):
-            media_sent = send_media(post, post["video_url"], "video/mp4", source)
+        r = telegram.call_stream(SEND_METHODS[kind], body, chat_id=chat_for(post), timeout=120)
+        if r.status_code == 200:
+            ok = True
+            remember_upload(url, digest.hexdigest(), r.json().get("result"), kind)
+            logger.info("Uploaded media for %s post %s (streamed %d bytes)", source, post['id'], total)
+        else:
+            logger.warning("Streamed %s for post %s returned %s: %s", SEND_METHODS[kind], post['id'], r.status_code, r.text)
+    except Exception:
+        logger.exception("Streaming upload failed for post %s", post['id'])
+    finally:
+        resp.close()
+    if ok:
+        return True
+
+    logger.info("Retrying post %s media via temp file download", post['id'])
+    fallback = prepare_media(url, stream=False)
+    return upload_prepared(post, fallback, source)
+
+def prepare_media(media_url, stream=None, try_direct=True):
+    """Resolve one media URL: a cached file_id if Telegram already has it, else a planned
+    stream (STREAM_UPLOADS) or a download to a temp file.
+    try_direct=False skips the plain download (see resolve_media)."""
+    found = find_uploaded(media_url)
+    if found:
+        return found
+    if stream is None:
+        stream = STREAM_UPLOADS
+    route = media_router.route(media_url)
+    if stream and try_direct and route.kind == DIRECT:
+        prepared = prepare_stream(media_url, route.url, route.content_type)
+        # pictures (and files of unknown type) are downloaded instead so they can be fingerprinted
+        if not (dedup_enabled() and media_kind(prepared["content_type"]) in ("photo", "document")):
+            return prepared
+    path, content_type, size, download_source = resolve_media(media_url, try_direct=try_direct)
+    if not path:
+        return {"kind": None}
+    fingerprint, found = match_downloaded(media_url, path, SEND_METHODS, content_type)
+    if found:
+        return found
+    return {
+        "kind": "media",
+        "url": media_url,
+        "path": path,
+        "content_type": content_type,
+        "size": size,
+        "download_source": download_source,
+        "sha256": fingerprint["sha256"],
+        "phash": fingerprint["phash"],
+    }
 
-        # gallery: try to download multiple images and send as an album
+def prepare_post(post):
+    """Download stage: fetch the media a post will upload, without touching Telegram.
+    Returns a dict consumed by upload_post: kind is 'media', 'stream', 'cached', 'duplicate',
+    'album' or None (text only).
+    """
+    prepared = {"kind": None}
+    try:
+        # priority: reddit video -> gallery -> direct url
+        if post.get("is_video") and post.get("video_url"):
+            media_url = post["video_url"]
         elif post.get("is_gallery") and post.get("gallery_urls"):
-            paths = []
-            for url in post["gallery_urls"][:10]:
-                pth, ctype, sz = download_media(url)
-                if not pth:
-                    pth, ctype, sz = ytdlp_download(url)
-                if pth:
-                    paths.append(pth)
-            if paths:
-                media_sent = send_album(paths, post, source)
-
-        # direct link (image or gif)
-        elif post.get("url"):
-            media_sent = send_media(post, post["url"], None, source)
+            return album_prepared(download_gallery(post["gallery_urls"]))
+        else:
+            media_url = post.get("url")
+
+        if media_url:
+            prepared = prepare_media(media_url)
+    except Exception:
+        logger.exception("Error while preparing media for post %s", post.get("id"))
+    return prepared
+
+def discard_prepared(prepared):
+    """Remove temp files of a prepared post that will not be uploaded."""
+    if not prepared:
+        return
+    if prepared.get("album"):
+        paths = [item["path"] for item in prepared["album"] if item.get("path")]
+    else:
+        paths = [prepared["path"]] if prepared.get("path") else []
+    for path in paths:
+        try:
+            shutil.rmtree(os.path.dirname(path), ignore_errors=True)
+        except Exception:
+            pass
+
+def recheck_prepared(prepared):
+    """Look prepared media up again right before it is uploaded. Posts are prepared
+    ahead of the upload stage, so an earlier post in the look-ahead window may have
+    sent the same media meanwhile; reuse its file_id rather than uploading the bytes."""
+    if prepared.get("kind") in ("media", "stream"):
+        found = find_uploaded(prepared["url"], prepared.get("sha256"), prepared.get("phash"))
+        if found:
+            logger.info("Media of %s was uploaded by an earlier post; not uploading it again", prepared["url"])
+            discard_prepared(prepared)
+            return found
+    elif prepared.get("kind") == "album":
+        album = []
+        for item in prepared["album"]:
+            found = item.get("path") and find_uploaded(item["url"], item.get("sha256"), item.get("phash"), ("photo",))
+            if found:
+                shutil.rmtree(os.path.dirname(item["path"]), ignore_errors=True)
+                item = album_item(item["url"], found)
+            album.append(item)
+        return album_prepared(album)
+    return prepared
+
+def cached_file_ids(prepared):
+    if prepared.get("kind") == "cached":
+        return [prepared["file_id"]]
+    if prepared.get("kind") == "duplicate" and not prepared.get("album"):
+        return [prepared["duplicate"]["file_id"]]
+    return [item["file_id"] for item in prepared.get("album") or [] if item.get("file_id")]
+
+def upload_prepared(post, prepared, source):
+    """Send prepared media. Returns True on success."""
+    if prepared.get("kind") == "album":
+        return send_album(prepared["album"], post, source)
+    if prepared.get("kind") == "cached":
+        return send_cached_media(post, prepared, source)
+    if prepared.get("kind") == "duplicate":
+        return send_duplicate(post, prepared, source)
+    if prepared.get("kind") == "media":
+        return upload_media(post, prepared, source)
+    if prepared.get("kind") == "stream":
+        return upload_stream(post, prepared, source)
+    return False
+
+def upload_post(post, prepared, source="subreddit"):
+    """Upload stage: send a prepared post to Telegram, falling back to a text/link message."""
+    # text/link message sent when there is no media or it could not be sent
+    text = caption_for(post, show_subreddit=True)
+
+    if not BOT_TOKEN or not chat_for(post):
+        logger.error("BOT_TOKEN or chat id not set; cannot send message")
+        discard_prepared(prepared)
+        return False
+
+    media_sent = False
+    try:
+        prepared = recheck_prepared(prepared)
+        media_sent = upload_prepared(post, prepared, source)
+        if not media_sent and cached_file_ids(prepared):
+            # Telegram may reject a stale file_id: forget it and upload the media afresh
+            for file_id in cached_file_ids(prepared):
+                file_id_cache.discard(file_id)
+            prepared = prepare_post(post)
+            media_sent = upload_prepared(post, prepared, source)
     except Exception:
         logger.exception("Error while attempting to send media for post %s", post.get("id"))
+        discard_prepared(prepared)
 
     if media_sent:
         return True
 
     # fallback: send text message with link
-    url_api = f"https://api.telegram.org/bot{BOT_TOKEN}/sendMessage"
     payload = {
-        "chat_id": CHAT_ID,
+        "chat_id": chat_for(post),
         "text": text,
         "parse_mode": "HTML",
         "disable_web_page_preview": False
     }
     try:
-        r = session.post(url_api, json=payload, timeout=10)
+        r = telegram.call("sendMessage", json=payload, timeout=10)
         if r.status_code != 200:
             logger.error("Telegram API returned %s for %s post %s: %s", r.status_code, source, post['id'], r.text)
             return False
         logger.info("Sent %s post %s to Telegram (link)", source, post['id'])
         return True
-    except requests.RequestException:
+    except Exception:
         logger.exception("Failed to send %s post to Telegram", source)
         return False
 
+def process_posts(posts, seen, source):
+    """Send posts through a download -> upload -> commit pipeline.
 
-def fetch_posts():
-    posts = []
-    try:
-        for post in reddit.subreddit(SUBREDDIT).top(time_filter="week", limit=SUBREDDIT_POST_LIMIT):
-            if "f4" in post.title.lower():
-                p = {
-                    "id": post.id,
-                    "title": post.title,
-                    "author": post.author.name if post.author else "[deleted]",
-                    "score": post.score,
-                    "permalink": f"https://reddit.com{post.permalink}",
-                    "url": getattr(post, "url", None),
-                    "is_video": getattr(post, "is_video", False),
-                }
-                # reddit hosted video
-                if p["is_video"] and getattr(post, "media", None):
-                    try:
-                        video = post.media.get("reddit_video", {})
-                        p["video_url"] = video.get("fallback_url")
-                    except Exception:
-                        p["video_url"] = None
-
-                # gallery
-                if getattr(post, "is_gallery", False):
-                    try:
-                        meta = getattr(post, "media_metadata", {})
-                        gallery = []
-                        for k in getattr(post, "gallery_data", {}).get("items", []):
-                            key = k.get("media_id")
-                            m = meta.get(key, {})
-                            # prefer 's' -> 'u'
-                            u = m.get("s", {}).get("u")
-                            if u:
-                                gallery.append(html.unescape(u).replace("&amp;", "&"))
-                        p["is_gallery"] = True
-                        p["gallery_urls"] = gallery
-                    except Exception:
-                        p["is_gallery"] = False
-                        p["gallery_urls"] = []
-                posts.append(p)
-        logger.info("Fetched %d posts from r/%s matching 'f4'", len(posts), SUBREDDIT)
-    except Exception as e:
-        logger.error("Failed to fetch posts from r/%s: %s", SUBREDDIT, e)
-    return posts
-
-
-def fetch_multireddit_posts(multireddit_name, filter_keyword=None):
-    posts = []
-    try:
-        multi = None
-        for m in reddit.user.multireddits():
-            if m.name.lower() == multireddit_name.lower():
-                multi = m
-                break
-
-        if not multi:
-            logger.warning("Multireddit '%s' not found for user", multireddit_name)
-            return posts
+    Up to PIPELINE_DEPTH posts are prepared (media downloaded) ahead of the upload
+    stage by PIPELINE_DOWNLOAD_WORKERS threads, so downloads for the next posts run
+    while the current one uploads. Uploads and seen-set updates stay in listing
+    order on the calling thread; Telegram pacing is left to common.ratelimit.
+    Returns True if any post was sent.
+    """
+    if not BOT_TOKEN:
+        logger.error("BOT_TOKEN not set; cannot send message")
+        return False
 
-        sort_func = getattr(multi, MULTIREDDIT_SORT, None)
-        if not callable(sort_func):
-            sort_func = multi.hot
+    sent_any = False
+    posts_iter = iter(posts)
+    pending = deque()
+    with ThreadPoolExecutor(max_workers=max(1, PIPELINE_DOWNLOAD_WORKERS), thread_name_prefix="prepare") as pool:
+        def fill():
+            # bounded look-ahead: never hold more than PIPELINE_DEPTH prepared posts
+            while len(pending) < max(1, PIPELINE_DEPTH):
+                post = next(posts_iter, None)
+                if post is None:
+                    return
+                pending.append((post, pool.submit(prepare_post, post)))
 
-        for post in sort_func(limit=MULTIREDDIT_POST_LIMIT):
-            if filter_keyword and filter_keyword.lower() not in post.title.lower():
-                continue
-            p = {
-                "id": post.id,
-                "title": post.title,
-                "author": post.author.name if post.author else "[deleted]",
-                "score": post.score,
-                "permalink": f"https://reddit.com{post.permalink}",
-                "subreddit": post.subreddit.display_name,
-                "url": getattr(post, "url", None),
-                "is_video": getattr(post, "is_video", False),
-            }
-            if p["is_video"] and getattr(post, "media", None):
+        try:
+            fill()
+            while pending:
+                post, future = pending.popleft()
+                fill()
+                prepared = future.result()
+                ok = upload_post(post, prepared, source)
+                # state commit stage
+                if ok:
+                    seen.add(post['id'])
+                    sent_any = True
+                else:
+                    logger.error("Failed to send %s post %s", source, post['id'])
+        finally:
+            # drop anything still queued if the upload stage aborted
+            for _, future in pending:
                 try:
-                    video = post.media.get("reddit_video", {})
-                    p["video_url"] = video.get("fallback_url")
+                    discard_prepared(future.result())
                 except Exception:
-                    p["video_url"] = None
+                    pass
+    return sent_any
+
+
+def load_feeds(path=FEEDS_FILE):
+    """Read the [[feed]] entries of the feed config with its [defaults] applied.
+    Each feed also gets a "key" (its seen-state source) and a "label" for logs."""
+    with open(path, "rb") as f:
+        config = tomllib.load(f)
+    defaults = config.get("defaults", {})
+    feeds = []
+    for entry in config.get("feed", []):
+        feed = {**defaults, **entry}
+        if bool(feed.get("subreddit")) == bool(feed.get("multireddit")):
+            raise ValueError(f"{path}: a feed needs exactly one of subreddit/multireddit: {entry}")
+        if feed.get("sort", "hot") not in FEED_SORTS:
+            raise ValueError(f"{path}: unknown sort {feed['sort']!r}; use one of {', '.join(FEED_SORTS)}")
+        if feed.get("subreddit"):
+            feed["key"] = f"reddit:{feed['subreddit'].lower()}"
+            feed["label"] = f"r/{feed['subreddit']}"
+        else:
+            feed["key"] = f"reddit:multi:{feed['multireddit'].lower()}"
+            feed["label"] = f"multireddit '{feed['multireddit']}'"
+        if any(f["key"] == feed["key"] for f in feeds):
+            raise ValueError(f"{path}: {feed['label']} is listed twice")
+        feeds.append(feed)
+    return feeds
+
+
+def snapshot_file(feed):
+    """JSON file holding a feed's last fetched listing."""
+    return os.path.join(DATA_DIR, feed["key"].replace(":", "_") + "_old.json")
+
+
+def find_multireddit(reddit, name):
+    for m in reddit.user.multireddits():
+        if m.name.lower() == name.lower():
+            return m
+    return None
+
+
+def post_to_dict(post, feed):
+    p = {
+        "id": post.id,
+        "title": post.title,
+        "author": post.author.name if post.author else "[deleted]",
+        "score": post.score,
+        "permalink": f"https://reddit.com{post.permalink}",
+        "url": getattr(post, "url", None),
+        "is_video": getattr(post, "is_video", False),
+    }
+    if feed.get("show_subreddit", bool(feed.get("multireddit"))):
+        p["subreddit"] = post.subreddit.display_name
+    if feed.get("chat_id"):
+        p["chat_id"] = str(feed["chat_id"])
+    # reddit hosted video
+    if p["is_video"] and getattr(post, "media", None):
+        try:
+            video = post.media.get("reddit_video", {})
+            p["video_url"] = video.get("fallback_url")
+        except Exception:
+            p["video_url"] = None
 
-            if getattr(post, "is_gallery", False):
-                try:
-                    meta = getattr(post, "media_metadata", {})
-                    gallery = []
-                    for k in getattr(post, "gallery_data", {}).get("items", []):
-                        key = k.get("media_id")
-                        m = meta.get(key, {})
-                        u = m.get("s", {}).get("u")
-                        if u:
-                            gallery.append(html.unescape(u).replace("&amp;", "&"))
-                    p["is_gallery"] = True
-                    p["gallery_urls"] = gallery
-                except Exception:
-                    p["is_gallery"] = False
-                    p["gallery_urls"] = []
+    # gallery
+    if getattr(post, "is_gallery", False):
+        try:
+            meta = getattr(post, "media_metadata", {})
+            gallery = []
+            for k in getattr(post, "gallery_data", {}).get("items", []):
+                key = k.get("media_id")
+                m = meta.get(key, {})
+                # prefer 's' -> 'u'
+                u = m.get("s", {}).get("u")
+                if u:
+                    gallery.append(html.unescape(u).replace("&amp;", "&"))
+            p["is_gallery"] = True
+            p["gallery_urls"] = gallery
+        except Exception:
+            p["is_gallery"] = False
+            p["gallery_urls"] = []
+    return p
 
-            # Exclude posts from r/gonewildaudio (handled elsewhere)
-            try:
-                if p.get("subreddit", "").lower() == "gonewildaudio":
-                    logger.debug("Skipping post %s from r/gonewildaudio", p["id"])
-                    continue
-            except Exception:
-                pass
 
-            posts.append(p)
-        logger.info("Fetched %d posts from multireddit '%s' (sort=%s)", len(posts), multireddit_name, MULTIREDDIT_SORT)
+def fetch_feed(feed):
+    """Fetch a feed's listing as post dicts, keeping the posts its filters allow."""
+    posts = []
+    sort = feed.get("sort", "hot")
+    title_contains = [t.lower() for t in feed.get("title_contains", [])]
+    title_excludes = [t.lower() for t in feed.get("title_excludes", [])]
+    exclude_subreddits = {s.lower() for s in feed.get("exclude_subreddits", [])}
+    try:
+        reddit = get_reddit()
+        if feed.get("subreddit"):
+            target = reddit.subreddit(feed["subreddit"])
+        else:
+            target = find_multireddit(reddit, feed["multireddit"])
+            if target is None:
+                logger.warning("Multireddit '%s' not found for user", feed["multireddit"])
+                return posts
+        kwargs = {"limit": feed.get("limit", 50)}
+        if sort in ("top", "controversial"):
+            kwargs["time_filter"] = feed.get("time_filter", "week")
+
+        for post in getattr(target, sort)(**kwargs):
+            title = post.title.lower()
+            if title_contains and not any(t in title for t in title_contains):
+                continue
+            if any(t in title for t in title_excludes):
+                continue
+            if exclude_subreddits and post.subreddit.display_name.lower() in exclude_subreddits:
+                logger.debug("Skipping post %s from excluded r/%s", post.id, post.subreddit.display_name)
+                continue
+            posts.append(post_to_dict(post, feed))
+        logger.info("Fetched %d posts from %s (sort=%s)", len(posts), feed["label"], sort)
     except praw.exceptions.APIException as e:
-        logger.error("Reddit API exception fetching multireddit '%s': %s", multireddit_name, e)
+        logger.error("Reddit API exception fetching %s: %s", feed["label"], e)
     except Exception as e:
-        logger.exception("Failed to fetch posts from multireddit '%s': %s", multireddit_name, e)
+        logger.exception("Failed to fetch posts from %s: %s", feed["label"], e)
     return posts
 
 
-def load_json(path):
-    try:
-        with open(path, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    except FileNotFoundError:
-        return []
-    except (ValueError, json.JSONDecodeError) as e:
-        logger.error("Failed to decode JSON from %s: %s", path, e)
-        # Move corrupt file aside so we don't repeatedly crash; start fresh
-        try:
-            ts = datetime.utcnow().strftime("%Y%m%dT%H%M%SZ")
-            corrupt_path = f"{path}.corrupt.{ts}"
-            os.replace(path, corrupt_path)
-            logger.warning("Moved corrupt JSON to %s and starting with an empty list", corrupt_path)
-        except Exception:
-            logger.exception("Failed to move corrupt JSON file %s", path)
-        return []
-
-
 def save_json(path, data):
     tmp = f"{path}.tmp"
     try:
@@ -753,20 +1131,39 @@ def save_json(path, data):
 def main():
     # ensure data dir exists
     os.makedirs(DATA_DIR, exist_ok=True)
+    global media_index
+    feeds = load_feeds()
+    store = StateStore(SEEN_DB_FILE)
+    media_index = MediaIndex(store, MEDIA_SOURCE)
+    try:
+        for old_source, seen_file, key in LEGACY_STATE:
+            store.migrate_json(old_source, seen_file, key=None)
+            store.rename_source(old_source, key)
+        run(store, feeds)
+    finally:
+        store.close()
+        file_id_cache.save()
+        redgifs_client.close()
+        ytdlp_client.close()
+
+
+def clear_feeds(store, feeds):
+    for feed in feeds:
+        store.clear(feed["key"])
+        save_json(snapshot_file(feed), [])
+
+
+def run(store, feeds):
     # Clear JSON state files only when appropriate:
     # - If manual override env vars are set (CLEAR_ALL_SEEN_ON_START or CLEAR_MULTIREDDIT_ON_START)
     # - Otherwise, if CLEAR_ON_CODECHANGE is enabled and the repo commit hash changed since last run
     try:
         if CLEAR_ALL_SEEN_ON_START:
-            logger.info("Clearing all seen/old JSON files at startup (CLEAR_ALL_SEEN_ON_START)")
-            save_json(SEEN_FILE, [])
-            save_json(OLD_FILE, [])
-            save_json(MULTIREDDIT_SEEN_FILE, [])
-            save_json(MULTIREDDIT_OLD_FILE, [])
+            logger.info("Clearing all seen/old state at startup (CLEAR_ALL_SEEN_ON_START)")
+            clear_feeds(store, feeds)
         elif CLEAR_MULTIREDDIT_ON_START:
-            logger.info("Clearing multireddit seen/old JSON files at startup (CLEAR_MULTIREDDIT_ON_START)")
-            save_json(MULTIREDDIT_SEEN_FILE, [])
-            save_json(MULTIREDDIT_OLD_FILE, [])
+            logger.info("Clearing multireddit seen/old state at startup (CLEAR_MULTIREDDIT_ON_START)")
+            clear_feeds(store, [f for f in feeds if f.get("multireddit")])
         else:
             # Try code-change detection via git commit hash
             if CLEAR_ON_CODECHANGE:
@@ -788,12 +1185,8 @@ def main():
 
                     if cur and cur != prev:
                         logger.info("Repository commit changed (prev=%s cur=%s). Clearing JSON files as configured.", prev, cur)
-                        # Clear either all or only multireddit files
-                        if CLEAR_ALL_ON_CODECHANGE:
-                            save_json(SEEN_FILE, [])
-                            save_json(OLD_FILE, [])
-                        save_json(MULTIREDDIT_SEEN_FILE, [])
-                        save_json(MULTIREDDIT_OLD_FILE, [])
+                        # Clear either all or only multireddit feeds
+                        clear_feeds(store, feeds if CLEAR_ALL_ON_CODECHANGE else [f for f in feeds if f.get("multireddit")])
                         try:
                             with open(LAST_COMMIT_FILE, 'w', encoding='utf-8') as fh:
                                 fh.write(cur)
@@ -804,74 +1197,36 @@ def main():
     except Exception:
         logger.exception("Failed while attempting to clear JSON files at startup")
 
-    # === Process subreddit posts ===
-    logger.info("=== Processing subreddit: %s ===", SUBREDDIT)
-    new_posts = fetch_posts()
-    seen = set(load_json(SEEN_FILE))
-    fresh_posts = [p for p in new_posts if p['id'] not in seen]
+    # feeds keep separate seen state, so they run side by side, sharing the download
+    # session, the Telegram client/rate limiter and the caches
+    with ThreadPoolExecutor(max_workers=max(1, min(FEED_CONCURRENCY, len(feeds))), thread_name_prefix="feed") as pool:
+        futures = [pool.submit(run_feed, store, feed) for feed in feeds]
+    errors = [f.exception() for f in futures if f.exception()]
+    store.prune(MEDIA_SOURCE, max_age=MEDIA_INDEX_MAX_AGE_DAYS * 86400)
+    if errors:
+        raise errors[0]
+
+
+def run_feed(store, feed):
+    """Fetch one feed, send the posts not seen before and save its snapshot."""
+    label = feed["label"]
+    logger.info("=== Processing %s ===", label)
+    posts = fetch_feed(feed)
+    seen = store.seen_set(feed["key"], pack=pack_base36)
+    # ids still on the listing count as recently used and are kept longest
+    seen.touch(p['id'] for p in posts)
+    fresh_posts = [p for p in posts if p['id'] not in seen]
 
     if not fresh_posts:
-        logger.info("No new posts to send from r/%s", SUBREDDIT)
+        logger.info("No new posts to send from %s", label)
     else:
-        logger.info("Found %d new posts from r/%s", len(fresh_posts), SUBREDDIT)
-
-    sent_any = False
-    for post in fresh_posts:
-        ok = send_telegram(post, source="subreddit")
-        if ok:
-            seen.add(post['id'])
-            sent_any = True
-        else:
-            logger.error("Failed to send subreddit post %s", post['id'])
-        # throttle between sends to avoid hitting Telegram rate limits
-        try:
-            time.sleep(DELAY_SECONDS)
-        except Exception:
-            pass
-
-    if sent_any or not os.path.exists(SEEN_FILE):
-        seen_list = list(seen)
-        MAX_SEEN = 10000
-        if len(seen_list) > MAX_SEEN:
-            seen_list = seen_list[-MAX_SEEN:]
-        save_json(SEEN_FILE, seen_list)
-
-    save_json(OLD_FILE, new_posts)
-
-    # === Process multireddit posts ===
-    logger.info("=== Processing multireddit: %s ===", MULTIREDDIT_NAME)
-    multi_posts = fetch_multireddit_posts(MULTIREDDIT_NAME)
-    multi_seen = set(load_json(MULTIREDDIT_SEEN_FILE))
-    multi_fresh_posts = [p for p in multi_posts if p['id'] not in multi_seen]
-
-    if not multi_fresh_posts:
-        logger.info("No new posts to send from multireddit '%s'", MULTIREDDIT_NAME)
-    else:
-        logger.info("Found %d new posts from multireddit '%s'", len(multi_fresh_posts), MULTIREDDIT_NAME)
-
-    multi_sent_any = False
-    for post in multi_fresh_posts:
-        ok = send_telegram(post, source="multireddit")
-        if ok:
-            multi_seen.add(post['id'])
-            multi_sent_any = True
-        else:
-            logger.error("Failed to send multireddit post %s", post['id'])
-        # throttle between sends to avoid hitting Telegram rate limits
-        try:
-            time.sleep(DELAY_SECONDS)
-        except Exception:
-            pass
-
-    if multi_sent_any or not os.path.exists(MULTIREDDIT_SEEN_FILE):
-        multi_seen_list = list(multi_seen)
-        MAX_SEEN = 10000
-        if len(multi_seen_list) > MAX_SEEN:
-            multi_seen_list = multi_seen_list[-MAX_SEEN:]
-        save_json(MULTIREDDIT_SEEN_FILE, multi_seen_list)
+        logger.info("Found %d new posts from %s", len(fresh_posts), label)
 
-    save_json(MULTIREDDIT_OLD_FILE, multi_posts)
+    # each sent post is recorded in the state database as soon as it is uploaded
+    process_posts(fresh_posts, seen, label)
+    seen.prune(SEEN_MAX_ENTRIES, SEEN_MAX_AGE_DAYS * 86400)
 
+    save_json(snapshot_file(feed), posts)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,24 @@
+import os
+import sys
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+
+from common.fetch import is_transient  # noqa: E402
+
+
+class FakeResponse:
+    def __init__(self, status_code, text="", server="cloudflare"):
+        self.status_code = status_code
+        self.text = text
+        self.headers = {"Server": server}
+
+
+def test_cloudflare_challenge_is_transient():
+    assert is_transient(FakeResponse(403, "<title>Just a moment...</title>"))
+    assert is_transient(FakeResponse(503, "origin down"))
+
+
+def test_plain_cloudflare_403_is_not_retried():
+    assert not is_transient(FakeResponse(403, "<h1>Access denied</h1> You have been banned"))
+    assert not is_transient(FakeResponse(404, "not found"))
@@ -0,0 +1,25 @@
+import os
+import sys
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+
+from common.listing_cache import ListingCache  # noqa: E402
+
+URL = "https://example.com/list"
+
+
+def test_unsent_items_keep_the_listing_from_being_skipped(tmp_path):
+    path = str(tmp_path / "listing_cache.json")
+    cache = ListingCache(path)
+    assert not cache.unchanged(URL, "<ul>a b</ul>")
+    cache.finish(URL, all_sent=False)
+    assert not ListingCache(path).unchanged(URL, "<ul>a b</ul>")
+
+
+def test_fully_sent_listing_is_skipped_next_run(tmp_path):
+    path = str(tmp_path / "listing_cache.json")
+    cache = ListingCache(path)
+    assert not cache.unchanged(URL, "<ul>a b</ul>")
+    cache.finish(URL)
+    assert ListingCache(path).unchanged(URL, "<ul>a b</ul>")
@@ -0,0 +1,78 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+
+from common import media_dedup  # noqa: E402
+from common.media_dedup import MediaIndex, perceptual_hash  # noqa: E402
+from common.state import StateStore  # noqa: E402
+
+Image = pytest.importorskip("PIL.Image")
+ImageDraw = pytest.importorskip("PIL.ImageDraw")
+
+
+@pytest.mark.parametrize("color", [(0, 0, 0), (3, 3, 3), (255, 255, 255), (120, 40, 40)])
+def test_uniform_pictures_have_no_hash(tmp_path, color):
+    path = tmp_path / "flat.png"
+    Image.new("RGB", (320, 240), color).save(path)
+    assert perceptual_hash(str(path), "image/png") is None
+
+
+def test_textured_picture_is_hashed(tmp_path):
+    path = tmp_path / "shapes.png"
+    img = Image.new("RGB", (320, 240), "white")
+    ImageDraw.Draw(img).ellipse((40, 40, 200, 200), fill="red")
+    ImageDraw.Draw(img).rectangle((210, 20, 300, 220), fill="blue")
+    img.save(path)
+    assert perceptual_hash(str(path), "image/png") is not None
+
+
+def black_intro_video(path, source):
+    """A 3 s clip whose first second is black, followed by the lavfi pattern source."""
+    subprocess.run(
+        [media_dedup.FFMPEG, "-v", "error", "-y", "-f", "lavfi", "-i", f"{source}=s=320x240:d=3:r=25",
+         "-vf", "drawbox=c=black:t=fill:enable='lt(t,1)'", "-pix_fmt", "yuv420p", str(path)],
+        check=True,
+    )
+
+
+@pytest.mark.skipif(not media_dedup.FFMPEG, reason="ffmpeg not installed")
+def test_black_intro_videos_do_not_match(tmp_path):
+    first, second = tmp_path / "a.mp4", tmp_path / "b.mp4"
+    black_intro_video(first, "testsrc")
+    black_intro_video(second, "smptebars")
+    hash_a = perceptual_hash(str(first), "video/mp4")
+    hash_b = perceptual_hash(str(second), "video/mp4")
+    assert hash_a is not None and hash_b is not None
+
+    store = StateStore(str(tmp_path / "state.db"))
+    try:
+        index = MediaIndex(store)
+        index.remember("sha-a", hash_a, {"message_id": 1, "chat": {"id": 7}}, "video", "file-a")
+        assert index.lookup("sha-b", hash_b) is None
+        assert index.lookup("sha-a2", hash_a)["message_id"] == 1
+    finally:
+        store.close()
+
+
+@pytest.mark.skipif(not media_dedup.FFMPEG, reason="ffmpeg not installed")
+def test_short_clip_falls_back_to_first_frame_when_seek_fails(tmp_path, monkeypatch):
+    clip = tmp_path / "short.mp4"
+    subprocess.run(
+        [media_dedup.FFMPEG, "-v", "error", "-y", "-f", "lavfi", "-i", "testsrc=s=320x240:d=0.5:r=25",
+         "-pix_fmt", "yuv420p", str(clip)],
+        check=True,
+    )
+    real_run = subprocess.run
+
+    def failing_seek(cmd, **kwargs):
+        if "-ss" in cmd:
+            raise subprocess.CalledProcessError(1, cmd)
+        return real_run(cmd, **kwargs)
+
+    monkeypatch.setattr(media_dedup.subprocess, "run", failing_seek)
+    assert perceptual_hash(str(clip), "video/mp4") is not None
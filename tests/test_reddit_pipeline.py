@@ -0,0 +1,129 @@
+import os
+import sys
+import tempfile
+import threading
+import time
+
+import pytest
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+sys.path.insert(0, os.path.join(BASE_DIR, "reddit"))
+
+import reddit_bot  # noqa: E402
+from common.media_cache import FileIdCache  # noqa: E402
+
+
+class FakeResponse:
+    status_code = 200
+    text = ""
+
+    def __init__(self, result):
+        self.result = result
+
+    def json(self):
+        return {"ok": True, "result": self.result}
+
+
+class FakeTelegram:
+    """Records calls; uploads are slow so later posts finish preparing first."""
+
+    def __init__(self):
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def call(self, method, data=None, files=None, json=None, timeout=None, cost=1):
+        time.sleep(0.2)
+        with self.lock:
+            self.calls.append((method, dict(data or json or {}), sorted(files or {})))
+            n = len(self.calls)
+        message = {"message_id": n, "chat": {"id": 1}}
+        if method == "sendMediaGroup":
+            return FakeResponse([dict(message, photo=[{"file_id": f"album{n}-{i}"}]) for i in range(10)])
+        kind = {"sendPhoto": "photo", "sendVideo": "video"}.get(method, "document")
+        message[kind] = [{"file_id": f"file{n}"}] if kind == "photo" else {"file_id": f"file{n}"}
+        return FakeResponse(message)
+
+
+def fake_download(url, max_bytes=None):
+    tmp_dir = tempfile.mkdtemp(prefix="test_media_")
+    path = os.path.join(tmp_dir, os.path.basename(url))
+    with open(path, "wb") as f:
+        f.write(url.encode())
+    ctype = "video/mp4" if url.endswith(".mp4") else "image/jpeg"
+    return path, ctype, os.path.getsize(path)
+
+
+@pytest.fixture
+def bot(tmp_path, monkeypatch):
+    telegram = FakeTelegram()
+    monkeypatch.setattr(reddit_bot, "telegram", telegram)
+    monkeypatch.setattr(reddit_bot, "BOT_TOKEN", "token")
+    monkeypatch.setattr(reddit_bot, "CHAT_ID", "1")
+    monkeypatch.setattr(reddit_bot, "STREAM_UPLOADS", False)
+    monkeypatch.setattr(reddit_bot, "PIPELINE_DEPTH", 4)
+    monkeypatch.setattr(reddit_bot, "media_index", None)
+    monkeypatch.setattr(reddit_bot, "file_id_cache", FileIdCache(str(tmp_path / "file_ids.json")))
+    monkeypatch.setattr(reddit_bot, "download_media", fake_download)
+    return telegram
+
+
+def post(i, **fields):
+    return dict({"id": f"p{i}", "title": f"post {i}", "author": "someone", "score": 1, "permalink": f"/r/x/{i}"}, **fields)
+
+
+def test_repeated_url_in_lookahead_window_is_uploaded_once(bot):
+    url = "https://i.redd.it/v1.mp4"
+    posts = [
+        post(1, url=url),
+        post(2, url="https://i.redd.it/a.jpg"),
+        post(3, url="https://i.redd.it/b.jpg"),
+        post(4, url=url),
+    ]
+    assert reddit_bot.process_posts(posts, set(), "test")
+    video_calls = [c for c in bot.calls if c[0] == "sendVideo"]
+    assert [files for _, _, files in video_calls] == [["video"], []]
+    assert video_calls[1][1]["video"] == "file1"
+
+
+def test_gallery_item_sent_by_earlier_post_is_not_uploaded_again(bot):
+    posts = [
+        post(1, url="https://i.redd.it/p.jpg"),
+        post(2, is_gallery=True, gallery_urls=["https://i.redd.it/p.jpg", "https://i.redd.it/q.jpg"]),
+    ]
+    assert reddit_bot.process_posts(posts, set(), "test")
+    method, data, files = bot.calls[-1]
+    assert method == "sendMediaGroup"
+    assert files == ["file1"]
+    assert '"media": "file1"' in data["media"]
+
+
+def test_stream_is_opened_only_when_uploaded(bot, monkeypatch):
+    opened = []
+
+    class FakeStream:
+        closed = False
+
+        def close(self):
+            self.closed = True
+
+    def fake_open(url, max_bytes=None):
+        resp = FakeStream()
+        opened.append(resp)
+        return resp, iter([b"rest"]), b"head", "video/mp4", 8
+
+    def call_stream(method, body, chat_id=None, timeout=None):
+        data = b"".join(body)
+        bot.calls.append((method, {}, ["stream"]))
+        assert b"headrest" in data
+        return FakeResponse({"message_id": 1, "chat": {"id": 1}, "video": {"file_id": "streamed"}})
+
+    monkeypatch.setattr(reddit_bot, "STREAM_UPLOADS", True)
+    monkeypatch.setattr(reddit_bot, "open_media_stream", fake_open)
+    monkeypatch.setattr(bot, "call_stream", call_stream, raising=False)
+    p = post(1, url="https://i.redd.it/clip.mp4")
+    prepared = reddit_bot.prepare_post(p)
+    assert prepared["kind"] == "stream" and not opened
+    assert reddit_bot.upload_post(p, prepared, "test")
+    assert len(opened) == 1 and opened[0].closed
+    assert bot.calls == [("sendVideo", {}, ["stream"])]
@@ -0,0 +1,44 @@
+import os
+import sys
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+
+from common.state import StateStore  # noqa: E402
+
+
+def test_history_is_rebuilt_after_unclean_exit(tmp_path):
+    path = str(tmp_path / "state.db")
+    store = StateStore(path)
+    store.add("src", "a")
+    store.close()
+
+    store = StateStore(path)
+    store.add("src", "b")
+    # the process dies: no close(), so the filter with "b" is never saved
+    store.conn.close()
+
+    store = StateStore(path)
+    try:
+        assert store.contains("src", "a")
+        assert store.contains("src", "b")
+    finally:
+        store.close()
+
+
+def test_run_without_changes_leaves_database_untouched(tmp_path):
+    path = str(tmp_path / "state.db")
+    store = StateStore(path)
+    store.add("src", "a")
+    store.close()
+    with open(path, "rb") as f:
+        before = f.read()
+
+    store = StateStore(path)
+    seen = store.seen_set("src")
+    assert "a" in seen and "b" not in seen
+    store.prune("src", max_entries=10)
+    store.close()
+    with open(path, "rb") as f:
+        assert f.read() == before
+    assert os.listdir(tmp_path) == ["state.db"]
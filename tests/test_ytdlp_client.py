@@ -0,0 +1,50 @@
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+
+from common import ytdlp_client  # noqa: E402
+
+
+class FakeYoutubeDL:
+    built = 0
+    active = 0
+    lock = threading.Lock()
+
+    def __init__(self, opts):
+        self.params = opts
+        self.in_use = False
+        with FakeYoutubeDL.lock:
+            FakeYoutubeDL.built += 1
+
+    def extract_info(self, url, download=False):
+        assert not self.in_use, "instance shared between threads"
+        self.in_use = True
+        time.sleep(0.01)
+        self.in_use = False
+        return {"id": url, "ext": "mp4"}
+
+    def close(self):
+        pass
+
+
+class FakeModule:
+    YoutubeDL = FakeYoutubeDL
+
+
+def test_instances_are_pooled_across_short_lived_threads(monkeypatch):
+    monkeypatch.setattr(ytdlp_client, "yt_dlp", FakeModule)
+    client = ytdlp_client.YtdlpClient(1000, pool_size=3)
+    # a fresh executor per batch, as for each gallery post
+    for batch in range(5):
+        with ThreadPoolExecutor(max_workers=6) as pool:
+            infos = list(pool.map(client.extract, [f"https://x/{batch}/{i}" for i in range(6)]))
+        assert all(infos)
+    assert FakeYoutubeDL.built == 3
+    assert client.created == 3
+    client.close()
+    assert client.created == 0